@@ -1,10 +1,14 @@
 import streamlit as st
-import pandas as pd
-import requests
 import datetime
-import calendar
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import os
+import time
+
+import memory
+import metrics
+import pipeline
+import prefetch
+import sections
+import snapshot
 
 # ページ設定
 st.set_page_config(page_title="案件進捗管理ダッシュボード", layout="wide")
@@ -15,457 +19,253 @@ st.title("📊 案件進捗管理ダッシュボード")
 # --- サイドバー設定 ---
 st.sidebar.header("設定 / フィルタ")
 
-# 1. API Key入力
-api_key = st.sidebar.text_input("MicroAd API Key", type="password")
+# 1. API Key入力（複数の広告主をまとめて見る場合はカンマ区切り、またはサーバーのキーファイル）
+api_key = st.sidebar.text_input("MicroAd API Key", type="password", help="カンマ区切りで複数のキーを入力すると、まとめて集計します")
+# API Key → 取得元の表示名
+sources = {key: pipeline.key_label(key) for key in pipeline.parse_keys(api_key)}
+file_sources = pipeline.read_keys_file()
+if file_sources and st.sidebar.checkbox(f"キーファイルの {len(file_sources)} 件をまとめて表示"):
+    sources.update(file_sources)
 
 # 2. 期間選択
-today = datetime.date.today()
-first_day = today.replace(day=1)
-start_date = st.sidebar.date_input("開始日", first_day)
-end_date = st.sidebar.date_input("終了日", today - datetime.timedelta(days=1))
+default_start, default_end = pipeline.default_range()
+start_date = st.sidebar.date_input("開始日", default_start)
+end_date = st.sidebar.date_input("終了日", default_end)
+st.sidebar.caption("複数月にまたがる期間は、月ごとの予算と理想進捗率で集計します（月別サマリを表示）。")
 
-# --- データ取得関数 ---
-def get_microad_data(api_key, start, end):
-    url = "https://report.ads-api.universe.microad.jp/v2/reports"
-    headers = {"x-api-key": api_key, "Content-Type": "application/json"}
-    payload = {
-        "start_date": start.strftime("%Y%m%d"),
-        "end_date": end.strftime("%Y%m%d"),
-        "report_type": "campaign"
-    }
-    try:
-        response = requests.request("GET", url, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        st.error(f"データ取得エラー: {e}")
-        return None
+# 3. 再取得日数（取得済みでも直近N日は数値確定前の可能性があるため取り直す）
+refetch_days = st.sidebar.number_input("直近の再取得日数", min_value=0, max_value=31, value=2)
 
-# --- 色分けロジック ---
-def color_diff_pacing(val):
-    if val > 10: return 'color: blue; font-weight: bold;'
-    elif 0 <= val <= 10: return 'color: black;'
-    elif -10 <= val < 0: return 'color: #D4AC0D; font-weight: bold;'
-    else: return 'color: red; font-weight: bold;'
+# 4. デバッグ表示（処理段階ごとの時間・行数・受信バイト数・メモリ）
+show_debug = st.sidebar.toggle("デバッグ情報を表示")
+trace_memory = show_debug and st.sidebar.checkbox("ピークメモリを計測（tracemalloc・低速）")
 
-def color_day_diff(val):
-    if val > 0: return 'color: blue; font-weight: bold;'
-    elif val < 0: return 'color: red; font-weight: bold;'
-    else: return 'color: black;'
+# この再実行 1 回分の計測（スクリプトの最後にログ・メトリクスファイルへ出力する）
+run_metrics = metrics.RunMetrics(trace_memory=trace_memory)
+
+# 取得結果のキャッシュ設定（TTL秒 / 最大保持件数。上限を超えると古いものから破棄）
+REPORT_CACHE_TTL = 60 * 30
+REPORT_CACHE_MAX_ENTRIES = 32
+
+# --- データ取得関数 ---
+@st.cache_resource
+def fetch_generations():
+    # API Key のハッシュ → 取得キャッシュの世代。キャッシュの破棄ではそのキーの世代だけを進め、
+    # 他のキー（他の利用者）の取得結果は残す
+    return {}
+
+@st.cache_data(ttl=REPORT_CACHE_TTL, max_entries=REPORT_CACHE_MAX_ENTRIES, show_spinner=False)
+def fetch_report(key_hash, _api_key, start, end, report_type, generation=0, _stage=None):
+    # _api_key は先頭の "_" によりキャッシュキーの計算対象外（key_hash と世代で識別する）
+    return pipeline.fetch_report(_api_key, start, end, report_type, _stage)
+
+def get_microad_data(sources, start, end, report_type="campaign", refetch_days=0, run_metrics=None):
+    # API Key ごとに、ローカルストアに無い日付（と直近 refetch_days 日）だけを API から取得し、期間全体はストアから返す。
+    # 複数のキーは並列に取得し、取得元を付けて 1 つにまとめる。失敗したキーはエラーを表示して除く
+    # （例外はキャッシュされないため、失敗した取得は次回クリック時に再試行される）
+    run_metrics = run_metrics or metrics.RunMetrics()
+    # リクエスト数・受信バイト数はキーごとに数えてから足す（取得スレッドから同じ辞書を更新しない）
+    key_stages = {key: {} for key in sources}
+    # キャッシュの世代は取得スレッドに渡す前に読んでおく
+    generations = {key: fetch_generations().get(pipeline.hash_api_key(key), 0) for key in sources}
+
+    def fetch(key):
+        key_hash = pipeline.hash_api_key(key)
+        return pipeline.sync_report(
+            key_hash, start, end,
+            lambda gap_start, gap_end: fetch_report(
+                key_hash, key, gap_start, gap_end, report_type, generations[key], key_stages[key],
+            ),
+            refetch_days,
+        )
+
+    with run_metrics.stage('fetch', sources=len(sources)) as stage:
+        frames, errors = pipeline.fetch_sources(sources, fetch)
+        stage['requests'] = sum(key_stage.get('requests', 0) for key_stage in key_stages.values())
+        stage['response_bytes'] = sum(key_stage.get('response_bytes', 0) for key_stage in key_stages.values())
+        stage['rows'] = 0 if frames is None else len(frames.records)
+    for label, e in errors.items():
+        st.error(f"データ取得エラー（{label}）: {e}")
+    return frames, list(errors)
+
+# --- 共有キャッシュ・事前取得 ---
+@st.cache_resource
+def background_prefetcher():
+    # サーバープロセスで 1 度だけ作成・起動し、全セッションで共有する
+    return prefetch.Prefetcher(prefetch.configured_keys(), prefetch.SharedCache()).start()
+
+prefetcher = background_prefetcher()
+shared_cache = prefetcher.cache
+
+def use_dashboard(entry):
+    # 共有キャッシュの結果をセッションに置く（フレームはコピーせず共有キャッシュと同じものを参照する）。
+    # 派生データは前の結果のものなので捨てる
+    st.session_state['dashboard'] = dict(entry['dashboard'], built_at=entry['built_at'], source=entry['source'])
+    sections.session_cache().clear()
+
+# 5. キャッシュの破棄（入力中の API Key の事前取得・取得済みの集計結果を捨て、次の「データ取得」で取り直す）
+if st.sidebar.button("キャッシュを破棄", disabled=not sources, help="入力中の API Key の分だけを破棄します"):
+    # 組み合わせの集計結果と、各キー単独の集計結果・取得結果を破棄する（他のキーの分は残す）
+    key_hashes = {pipeline.hash_api_key(key) for key in sources}
+    dropped = sum(shared_cache.invalidate(key_hash) for key_hash in key_hashes | {pipeline.sources_hash(sources)})
+    generations = fetch_generations()
+    for key_hash in key_hashes:
+        generations[key_hash] = generations.get(key_hash, 0) + 1
+    st.session_state.pop('dashboard', None)
+    sections.session_cache().clear()
+    st.sidebar.caption(f"集計結果 {dropped} 件を破棄しました。")
+if prefetcher.api_keys:
+    if st.sidebar.button("事前取得を今すぐ実行"):
+        prefetcher.refresh_now()
+    if prefetcher.next_run_at:
+        st.sidebar.caption(f"事前取得: {len(prefetcher.api_keys)} 件 / 次回 {datetime.datetime.fromtimestamp(prefetcher.next_run_at):%H:%M}")
 
 # --- メイン処理 ---
+# 取得・集計結果は session_state に保持し、ウィジェット操作による再実行ではメモリから再描画する
 if st.sidebar.button("データ取得"):
-    if not api_key:
+    if not sources:
         st.warning("API Keyを入力してください。")
     else:
-        with st.spinner("データを取得中..."):
-            data = get_microad_data(api_key, start_date, end_date)
-            
-        if data:
-            # 1. マスタ作成
-            campaigns = []
-            if 'account' in data:
-                for acc in data['account']:
-                    acc_name = acc.get('name', 'Unknown')
-                    if 'campaign' in acc:
-                        for camp in acc['campaign']:
-                            target_month = start_date.strftime("%Y%m")
-                            monthly_limit = 0
-                            if 'campaign_monthly_charge_limit' in camp:
-                                for limit in camp['campaign_monthly_charge_limit']:
-                                    if limit.get('month') == target_month:
-                                        monthly_limit = limit.get('charge_limit', 0)
-                                        break
-                            campaigns.append({
-                                'campaign_id': camp['id'],
-                                'account_name': acc_name,
-                                'campaign_name': camp['name'],
-                                'monthly_budget': monthly_limit
-                            })
-            master_df = pd.DataFrame(campaigns)
-
-            # 2. 実績データ作成
-            records = []
-            if 'report' in data and 'records' in data['report']:
-                records = data['report']['records']
-            
-            if not records:
-                st.warning("指定期間の配信実績データがありません。")
-            else:
-                perf_df = pd.DataFrame(records)
-                numeric_cols = ['net', 'gross', 'impression', 'click']
-                for col in numeric_cols:
-                    if col in perf_df.columns:
-                        perf_df[col] = pd.to_numeric(perf_df[col], errors='coerce').fillna(0)
-                
-                if 'target_date' in perf_df.columns:
-                    perf_df['target_date'] = pd.to_datetime(perf_df['target_date'].astype(str))
-                
-                # 集計処理
-                agg_df = perf_df.groupby('campaign_id')[numeric_cols].sum().reset_index()
-                
-                # 前日比計算
-                if 'target_date' in perf_df.columns and not perf_df.empty:
-                    latest_date = perf_df['target_date'].max()
-                    prev_date = latest_date - datetime.timedelta(days=1)
-                    
-                    target_cols = ['gross', 'impression', 'click']
-                    latest_df = perf_df[perf_df['target_date'] == latest_date].groupby('campaign_id')[target_cols].sum().reset_index()
-                    prev_df = perf_df[perf_df['target_date'] == prev_date].groupby('campaign_id')[target_cols].sum().reset_index()
-                    
-                    latest_df = latest_df.rename(columns={'gross':'l_gross', 'impression':'l_imp', 'click':'l_click'})
-                    prev_df = prev_df.rename(columns={'gross':'p_gross', 'impression':'p_imp', 'click':'p_click'})
-                    
-                    # --- CTR計算 ---
-                    latest_df['l_ctr'] = (latest_df['l_click'] / latest_df['l_imp'] * 100).fillna(0)
-                    prev_df['p_ctr'] = (prev_df['p_click'] / prev_df['p_imp'] * 100).fillna(0)
-                    
-                    daily_diff_df = pd.merge(latest_df, prev_df, on='campaign_id', how='left').fillna(0)
-                    daily_diff_df['diff_gross'] = daily_diff_df['l_gross'] - daily_diff_df['p_gross']
-                    daily_diff_df['diff_imp'] = daily_diff_df['l_imp'] - daily_diff_df['p_imp']
-                    daily_diff_df['diff_click'] = daily_diff_df['l_click'] - daily_diff_df['p_click']
-                    daily_diff_df['diff_ctr'] = daily_diff_df['l_ctr'] - daily_diff_df['p_ctr']
-                    
-                    daily_diff_df = daily_diff_df[[
-                        'campaign_id', 
-                        'l_gross', 'diff_gross', 
-                        'l_imp', 'diff_imp', 
-                        'l_click', 'diff_click',
-                        'l_ctr', 'diff_ctr'
-                    ]]
-                    daily_diff_df = daily_diff_df.rename(columns={
-                        'l_gross':'latest_gross', 
-                        'l_imp':'latest_imp', 
-                        'l_click':'latest_click',
-                        'l_ctr':'latest_ctr'
-                    })
+        key_hash = pipeline.sources_hash(sources)
+        cached_entry = shared_cache.get(key_hash, start_date, end_date)
+        if cached_entry is not None and not prefetch.is_stale(cached_entry):
+            # 事前取得（または他のセッション）で集計済みなら、取得も集計もせずに使う
+            use_dashboard(cached_entry)
+        else:
+            with st.spinner("データを取得中..."):
+                frames, failed_sources = get_microad_data(sources, start_date, end_date, refetch_days=refetch_days, run_metrics=run_metrics)
+
+            if frames is not None:
+                dashboard = pipeline.build_dashboard(frames, start_date, end_date, run_metrics)
+                if dashboard is None:
+                    st.session_state.pop('dashboard', None)
+                    st.warning("指定期間の配信実績データがありません。")
                 else:
-                    daily_diff_df = pd.DataFrame(columns=[
-                        'campaign_id', 'latest_gross', 'diff_gross', 
-                        'latest_imp', 'diff_imp', 'latest_click', 'diff_click', 
-                        'latest_ctr', 'diff_ctr'
-                    ])
-
-                # 結合
-                merged_df = pd.merge(agg_df, master_df, on='campaign_id', how='left')
-                merged_df = pd.merge(merged_df, daily_diff_df, on='campaign_id', how='left')
-                
-                # 進捗計算
-                year = end_date.year
-                month = end_date.month
-                _, num_days_in_month = calendar.monthrange(year, month)
-                days_elapsed = end_date.day
-                standard_pacing = (days_elapsed / num_days_in_month) * 100
-                
-                merged_df['progress_percent'] = merged_df.apply(lambda x: (x['gross']/x['monthly_budget']*100) if x['monthly_budget']>0 else 0, axis=1)
-                merged_df['daily_progress_diff'] = merged_df.apply(lambda x: (x['latest_gross']/x['monthly_budget']*100) if x['monthly_budget']>0 else 0, axis=1)
-                merged_df['diff_point'] = merged_df['progress_percent'] - standard_pacing
-                
-                merged_df['period_ctr'] = merged_df.apply(lambda x: (x['click'] / x['impression'] * 100) if x['impression'] > 0 else 0, axis=1)
-
-                # 表示用DF
-                display_df = merged_df[[
-                    'account_name', 'campaign_name', 'monthly_budget', 'gross', 
-                    'progress_percent', 'daily_progress_diff', 'diff_point',
-                    'latest_gross', 'diff_gross', 
-                    'impression', 'click', 'period_ctr',
-                    'latest_imp', 'diff_imp', 
-                    'latest_click', 'diff_click',
-                    'latest_ctr', 'diff_ctr'
-                ]].copy()
-                
-                display_df.columns = [
-                    'アカウント名', 'キャンペーン名', '当月予算', '期間消化額', 
-                    '進捗率(%)', '進捗前日比', '乖離(pt)',
-                    '昨日消化', '消化前日比', 
-                    '期間IMP', '期間Click', '期間CTR',
-                    '昨日IMP', 'IMP前日比', 
-                    '昨日Click', 'Click前日比',
-                    '昨日CTR', 'CTR前日比'
-                ]
-
-                table_display_df = display_df.copy()
-
-                # --- 全体サマリ ---
-                st.markdown("---")
-                
-                st.markdown("##### 💰 予算・消化状況（全体）")
-                r1c1, r1c2, r1c3, r1c4, r1c5 = st.columns(5)
-                
-                total_budget = table_display_df['当月予算'].sum()
-                total_gross = table_display_df['期間消化額'].sum()
-                
-                r1c1.metric("当月予算合計", f"¥{total_budget:,.0f}")
-                r1c2.metric("合計消化額 (Gross)", f"¥{total_gross:,.0f}")
-                r1c3.metric("昨日の合計消化額", f"¥{table_display_df['昨日消化'].sum():,.0f}", f"{table_display_df['消化前日比'].sum():+,.0f} 円")
-                r1c4.metric("当月の理想進捗率", f"{standard_pacing:.1f}%", f"{end_date.month}/{end_date.day} 時点")
-                avg_prog = table_display_df[table_display_df['当月予算']>0]['進捗率(%)'].mean()
-                r1c5.metric("平均実績進捗率", f"{avg_prog:.1f}%", delta=f"{avg_prog - standard_pacing:.1f} pt")
-
-                st.markdown("##### 🚨 予測・アラート")
-                period_days_so_far = (end_date - start_date).days + 1
-                if period_days_so_far < 1: period_days_so_far = 1
-                
-                avg_daily_burn = total_gross / period_days_so_far
-                remaining_budget = total_budget - total_gross
-                
-                a1, a2, a3, a4 = st.columns(4)
-                if avg_daily_burn > 0:
-                    days_to_exhaustion = remaining_budget / avg_daily_burn
-                    if days_to_exhaustion < (num_days_in_month - days_elapsed):
-                        a1.error(f"あと {days_to_exhaustion:.1f} 日で枯渇")
+                    # 取得・集計の計測結果は、以降の再実行でもデバッグ表示できるように残しておく
+                    dashboard['build_metrics'] = run_metrics.records()
+                    if failed_sources:
+                        # 一部のキーが欠けた結果は共有キャッシュに置かない（次の「データ取得」で取り直す）
+                        dashboard['failed_sources'] = failed_sources
+                        use_dashboard({'dashboard': dashboard, 'built_at': time.time(), 'source': 'button'})
                     else:
-                        a1.metric("予算枯渇予測", f"あと {days_to_exhaustion:.1f} 日")
-                else:
-                    a1.metric("予算枯渇予測", "消化なし")
-
-                st.markdown("##### 👁️ インプレッション・クリック状況 (全体合計)")
-                r2c1, r2c2, r2c3, r2c4 = st.columns(4)
-                r2c1.metric("期間合計IMP", f"{table_display_df['期間IMP'].sum():,.0f}")
-                r2c2.metric("期間合計Click", f"{table_display_df['期間Click'].sum():,.0f}")
-                r2c3.metric("昨日のIMP", f"{table_display_df['昨日IMP'].sum():,.0f}", f"{table_display_df['IMP前日比'].sum():+,.0f}")
-                r2c4.metric("昨日のClick", f"{table_display_df['昨日Click'].sum():,.0f}", f"{table_display_df['Click前日比'].sum():+,.0f}")
-
-                st.markdown("##### 📊 平均指標・効率 (全体平均)")
-                r3c1, r3c2, r3c3, r3c4 = st.columns(4)
-                
-                total_imp = table_display_df['期間IMP'].sum()
-                total_click = table_display_df['期間Click'].sum()
-                
-                daily_avg_imp = total_imp / period_days_so_far
-                daily_avg_click = total_click / period_days_so_far
-                ctr = (total_click / total_imp * 100) if total_imp > 0 else 0
-                cpm = (total_gross / total_imp * 1000) if total_imp > 0 else 0
-                
-                r3c1.metric("平均IMP (日別)", f"{daily_avg_imp:,.0f}")
-                r3c2.metric("平均Click (日別)", f"{daily_avg_click:,.0f}")
-                r3c3.metric("平均CTR", f"{ctr:.2f}%")
-                r3c4.metric("平均CPM (仕入単価)", f"¥{cpm:,.0f}")
-
-                # --- 詳細テーブル ---
-                st.markdown("---")
-                st.markdown("### 📋 キャンペーン別詳細")
-                st.caption("乖離： 🟦ハイペース(>+10) | ⬛順調 | 🟨警戒 | 🟥危険(<-10)")
-                st.info("💡 **表の右上にある虫眼鏡マーク🔍** や列名をクリックすることで、表の中で検索・並べ替えができます。")
-                
-                styled_df = table_display_df.style.format({
-                    '当月予算': '¥{:,.0f}', '期間消化額': '¥{:,.0f}',
-                    '進捗率(%)': '{:.1f}%', '進捗前日比': '{:+.1f}pt', '乖離(pt)': '{:+.1f}',
-                    '昨日消化': '¥{:,.0f}', '消化前日比': '{:+,.0f}',
-                    '期間IMP': '{:,.0f}', '期間Click': '{:,.0f}', '期間CTR': '{:.2f}%',
-                    '昨日IMP': '{:,.0f}', 'IMP前日比': '{:+,.0f}',
-                    '昨日Click': '{:,.0f}', 'Click前日比': '{:+,.0f}',
-                    '昨日CTR': '{:.2f}%', 'CTR前日比': '{:+.2f}pt'
-                }).map(color_diff_pacing, subset=['乖離(pt)'])\
-                  .map(color_day_diff, subset=['消化前日比', 'IMP前日比', 'Click前日比', 'CTR前日比'])
-
-                st.dataframe(styled_df, use_container_width=True, height=600)
-
-                # ========================================================
-                # 📈 グラフ描画セクション
-                # ========================================================
-                st.markdown("---")
-                st.markdown("### 📈 詳細分析（グラフ）")
-                
-                account_list = sorted(master_df['account_name'].unique())
-                campaign_list = sorted(master_df['campaign_name'].unique())
-                
-                graph_options = ["全体合計"] + \
-                                [f"【アカウント】{acc}" for acc in account_list] + \
-                                [f"【キャンペーン】{camp}" for camp in campaign_list]
-                
-                selected_graph_item = st.selectbox("グラフを表示する対象を選択", graph_options)
-                
-                target_data = None
-                target_budget_graph = 0
-                graph_title_prefix = selected_graph_item
-                
-                # データ抽出
-                if selected_graph_item == "全体合計":
-                    target_data = perf_df.groupby('target_date')[['gross', 'impression', 'click']].sum().reset_index()
-                    target_budget_graph = master_df['monthly_budget'].sum()
-                elif selected_graph_item.startswith("【アカウント】"):
-                    target_acc_name = selected_graph_item.replace("【アカウント】", "")
-                    target_ids = master_df[master_df['account_name'] == target_acc_name]['campaign_id'].values
-                    target_budget_graph = master_df[master_df['account_name'] == target_acc_name]['monthly_budget'].sum()
-                    base_data = perf_df[perf_df['campaign_id'].isin(target_ids)].copy()
-                    if not base_data.empty:
-                        target_data = base_data.groupby('target_date')[['gross', 'impression', 'click']].sum().reset_index()
-                else:
-                    target_camp_name = selected_graph_item.replace("【キャンペーン】", "")
-                    target_rows = master_df[master_df['campaign_name'] == target_camp_name]
-                    if not target_rows.empty:
-                        target_camp_id = target_rows.iloc[0]['campaign_id']
-                        target_budget_graph = target_rows.iloc[0]['monthly_budget']
-                        target_data = perf_df[perf_df['campaign_id'] == target_camp_id].copy()
-                        target_data = target_data[['target_date', 'gross', 'impression', 'click']]
-
-                # グラフ描画
-                if target_data is not None and not target_data.empty:
-                    target_data = target_data.sort_values('target_date')
-                    target_data['cum_gross'] = target_data['gross'].cumsum()
-                    target_data['cum_imp'] = target_data['impression'].cumsum()
-                    target_data['cum_click'] = target_data['click'].cumsum()
-                    
-                    target_data['daily_ctr'] = (target_data['click'] / target_data['impression'] * 100).fillna(0)
-                    target_data['cum_ctr'] = (target_data['cum_click'] / target_data['cum_imp'] * 100).fillna(0)
-                    target_data['daily_cpm'] = (target_data['gross'] / target_data['impression'] * 1000).fillna(0)
-
-                    # 残予算計算（グラフ用）
-                    if target_budget_graph > 0:
-                        target_data['remaining_budget'] = target_budget_graph - target_data['cum_gross']
-                        target_data['actual_progress'] = (target_data['cum_gross'] / target_budget_graph) * 100
-                    else:
-                        target_data['remaining_budget'] = 0
-                        target_data['actual_progress'] = 0
-
-                    last_day_of_month = calendar.monthrange(start_date.year, start_date.month)[1]
-                    month_dates = [datetime.date(start_date.year, start_date.month, d) for d in range(1, last_day_of_month + 1)]
-                    ideal_df = pd.DataFrame({'date': month_dates})
-                    ideal_df['date'] = pd.to_datetime(ideal_df['date'])
-                    ideal_df['ideal_progress'] = (ideal_df.index + 1) / last_day_of_month * 100
-
-                    daily_target_budget = target_budget_graph / last_day_of_month
-                    daily_target_click = daily_target_budget / 100
-                    ideal_df['ideal_cum_click'] = (ideal_df.index + 1) * daily_target_click
-                    ideal_df['ideal_daily_click'] = daily_target_click
-
-                    # 予測・挽回計算
-                    latest_actual_date = target_data['target_date'].max()
-                    latest_cum_gross = target_data.loc[target_data['target_date'] == latest_actual_date, 'cum_gross'].values[0]
-                    latest_cum_click = target_data.loc[target_data['target_date'] == latest_actual_date, 'cum_click'].values[0]
-                    days_remaining = (ideal_df['date'].max() - latest_actual_date).days
-                    
-                    forecast_df = pd.DataFrame() 
-                    recovery_df = pd.DataFrame()
-
-                    if days_remaining > 0:
-                        future_dates = [latest_actual_date + datetime.timedelta(days=i) for i in range(1, days_remaining + 1)]
-                        days_elapsed_val = (latest_actual_date.date() - start_date).days + 1
-                        if days_elapsed_val < 1: days_elapsed_val = 1
-                        
-                        avg_daily_gross = latest_cum_gross / days_elapsed_val
-                        avg_daily_click = latest_cum_click / days_elapsed_val
-                        
-                        forecast_values_gross = [latest_cum_gross + (avg_daily_gross * i) for i in range(1, days_remaining + 1)]
-                        forecast_values_click = [latest_cum_click + (avg_daily_click * i) for i in range(1, days_remaining + 1)]
-                        
-                        forecast_df = pd.DataFrame({
-                            'date': future_dates,
-                            'forecast_cum_gross': forecast_values_gross,
-                            'forecast_cum_click': forecast_values_click
-                        })
-                        if target_budget_graph > 0:
-                            forecast_df['forecast_progress'] = (forecast_df['forecast_cum_gross'] / target_budget_graph) * 100
-                        else:
-                            forecast_df['forecast_progress'] = 0
-
-                        remaining_budget = target_budget_graph - latest_cum_gross
-                        if remaining_budget < 0: remaining_budget = 0
-                        req_daily_gross = remaining_budget / days_remaining
-                        req_daily_click = req_daily_gross / 100
-                        
-                        recovery_df = pd.DataFrame({
-                            'date': future_dates,
-                            'req_daily_click': [req_daily_click] * days_remaining,
-                            'recovery_progress': [0] * days_remaining # dummy
-                        })
-                        # 挽回進捗は計算省略(使わないため)
-                        if target_budget_graph > 0:
-                             # グラフ描画に必要な列だけ計算
-                             recovery_cum_gross = [latest_cum_gross + (req_daily_gross * i) for i in range(1, days_remaining + 1)]
-                             recovery_df['recovery_progress'] = [(val / target_budget_graph * 100) for val in recovery_cum_gross]
-                             recovery_cum_click = [latest_cum_click + (req_daily_click * i) for i in range(1, days_remaining + 1)]
-                             recovery_df['recovery_cum_click'] = recovery_cum_click
-
-
-                    # --------------------------------------------------------
-                    # グラフ1：進捗・ボリューム分析
-                    # --------------------------------------------------------
-                    st.subheader("① 予算・ボリューム分析（進捗 & Click）")
-                    fig1 = make_subplots(
-                        rows=3, cols=1, 
-                        shared_xaxes=True, 
-                        vertical_spacing=0.08,
-                        subplot_titles=(f"進捗率の推移", f"累積Click推移", f"日別Click推移"),
-                        specs=[[{"secondary_y": False}], [{"secondary_y": True}], [{"secondary_y": True}]]
-                    )
-                    fig1.add_trace(go.Scatter(x=ideal_df['date'], y=ideal_df['ideal_progress'], mode='lines', name='理想線', line=dict(color='lightgray', dash='dot')), row=1, col=1)
-                    fig1.add_trace(go.Scatter(x=target_data['target_date'], y=target_data['actual_progress'], mode='lines+markers', name='実績', line=dict(color='red', width=3)), row=1, col=1)
-                    if not forecast_df.empty:
-                        fig1.add_trace(go.Scatter(x=forecast_df['date'], y=forecast_df['forecast_progress'], mode='lines', name='予測(現状維持)', line=dict(color='green', dash='dot')), row=1, col=1)
-                    if not recovery_df.empty:
-                        fig1.add_trace(go.Scatter(x=recovery_df['date'], y=recovery_df['recovery_progress'], mode='lines', name='必要ペース', line=dict(color='deeppink', dash='dot')), row=1, col=1)
-
-                    fig1.add_trace(go.Scatter(x=ideal_df['date'], y=ideal_df['ideal_cum_click'], name='理想累積(CPC100円)', mode='lines', line=dict(color='lightgray', dash='dot')), row=2, col=1, secondary_y=True)
-                    fig1.add_trace(go.Scatter(x=target_data['target_date'], y=target_data['cum_click'], name='実績累積Click', mode='lines+markers', line=dict(color='orange', width=2)), row=2, col=1, secondary_y=True)
-                    if not forecast_df.empty:
-                        fig1.add_trace(go.Scatter(x=forecast_df['date'], y=forecast_df['forecast_cum_click'], name='予測累積Click', mode='lines', line=dict(color='green', dash='dot')), row=2, col=1, secondary_y=True)
-                    if not recovery_df.empty:
-                        fig1.add_trace(go.Scatter(x=recovery_df['date'], y=recovery_df['recovery_cum_click'], name='必要累積Click', mode='lines', line=dict(color='deeppink', dash='dot')), row=2, col=1, secondary_y=True)
-                    fig1.add_trace(go.Bar(x=target_data['target_date'], y=target_data['cum_imp'], name='実績累積IMP', opacity=0.1, marker_color='gray'), row=2, col=1, secondary_y=False)
-
-                    fig1.add_trace(go.Scatter(x=target_data['target_date'], y=target_data['click'], name='日別Click', mode='lines+markers', line=dict(color='navy', width=2)), row=3, col=1, secondary_y=True)
-                    fig1.add_trace(go.Scatter(x=ideal_df['date'], y=ideal_df['ideal_daily_click'], name='理想日別(CPC100円)', mode='lines', line=dict(color='lightgray', dash='dot')), row=3, col=1, secondary_y=True)
-                    if not recovery_df.empty:
-                        fig1.add_trace(go.Scatter(x=recovery_df['date'], y=recovery_df['req_daily_click'], name='明日からの必要数', mode='lines', line=dict(color='deeppink', dash='dot', width=2)), row=3, col=1, secondary_y=True)
-                    fig1.add_trace(go.Bar(x=target_data['target_date'], y=target_data['impression'], name='日別IMP', opacity=0.4, marker_color='lightblue'), row=3, col=1, secondary_y=False)
-
-                    fig1.update_layout(height=900, showlegend=True, hovermode="x unified")
-                    fig1.update_yaxes(title_text="進捗率 (%)", range=[0, 110], row=1, col=1)
-                    fig1.update_yaxes(title_text="累積IMP", row=2, col=1, secondary_y=False)
-                    fig1.update_yaxes(title_text="累積Click", row=2, col=1, secondary_y=True)
-                    fig1.update_yaxes(title_text="日別IMP", row=3, col=1, secondary_y=False)
-                    fig1.update_yaxes(title_text="日別Click", row=3, col=1, secondary_y=True)
-                    st.plotly_chart(fig1, use_container_width=True)
-
-                    # --------------------------------------------------------
-                    # グラフ2：効率・品質分析
-                    # --------------------------------------------------------
-                    st.subheader("② 効率・品質分析（CTR & CPM）")
-                    fig2 = make_subplots(
-                        rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.1,
-                        subplot_titles=(f"CTR(クリック率)推移", f"コスト効率分析 [CPM vs CTR]"),
-                        specs=[[{"secondary_y": False}], [{"secondary_y": True}]]
-                    )
-                    fig2.add_trace(go.Scatter(x=target_data['target_date'], y=target_data['daily_ctr'], name='日別CTR', mode='lines+markers', line=dict(color='blue', width=2)), row=1, col=1)
-                    fig2.add_trace(go.Scatter(x=target_data['target_date'], y=target_data['cum_ctr'], name='累計CTR', mode='lines', line=dict(color='orange', dash='dot', width=2)), row=1, col=1)
-                    
-                    fig2.add_trace(go.Bar(x=target_data['target_date'], y=target_data['daily_cpm'], name='日別CPM', opacity=0.6, marker_color='purple'), row=2, col=1, secondary_y=False)
-                    fig2.add_trace(go.Scatter(x=target_data['target_date'], y=target_data['daily_ctr'], name='日別CTR', mode='lines+markers', line=dict(color='blue', width=2)), row=2, col=1, secondary_y=True)
-                    
-                    fig2.update_layout(height=700, showlegend=True, hovermode="x unified")
-                    fig2.update_yaxes(title_text="CTR (%)", row=1, col=1)
-                    fig2.update_yaxes(title_text="CPM (円)", row=2, col=1, secondary_y=False)
-                    fig2.update_yaxes(title_text="CTR (%)", row=2, col=1, secondary_y=True)
-                    st.plotly_chart(fig2, use_container_width=True)
-
-                    # --------------------------------------------------------
-                    # ★新規グラフ3：予算管理分析（Gross & Budget）
-                    # --------------------------------------------------------
-                    st.subheader("③ 予算管理分析（Gross & Budget）")
-                    fig3 = make_subplots(
-                        rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.1,
-                        subplot_titles=(f"累積消化額 vs 残予算の推移", f"日別消化額の推移"),
-                        specs=[[{"secondary_y": True}], [{"secondary_y": False}]]
-                    )
-
-                    # 上段: 累積消化(面) vs 残予算(線)
-                    fig3.add_trace(go.Scatter(x=target_data['target_date'], y=target_data['cum_gross'], name='累積消化額', mode='lines', fill='tozeroy', line=dict(color='royalblue')), row=1, col=1, secondary_y=False)
-                    fig3.add_trace(go.Scatter(x=target_data['target_date'], y=target_data['remaining_budget'], name='残予算', mode='lines', line=dict(color='mediumseagreen', width=3)), row=1, col=1, secondary_y=True)
-                    # 予算上限ライン
-                    fig3.add_trace(go.Scatter(x=[target_data['target_date'].min(), target_data['target_date'].max()], y=[target_budget_graph, target_budget_graph], name='予算上限', mode='lines', line=dict(color='red', dash='dot')), row=1, col=1, secondary_y=False)
-
-                    # 下段: 日別消化
-                    fig3.add_trace(go.Bar(x=target_data['target_date'], y=target_data['gross'], name='日別消化額', marker_color='royalblue'), row=2, col=1)
-                    # 日割り目安
-                    fig3.add_trace(go.Scatter(x=ideal_df['date'], y=[daily_target_budget]*len(ideal_df), name='日割り目安', mode='lines', line=dict(color='gray', dash='dot')), row=2, col=1)
-
-                    fig3.update_layout(height=700, showlegend=True, hovermode="x unified")
-                    fig3.update_yaxes(title_text="累積消化額 (円)", row=1, col=1, secondary_y=False)
-                    fig3.update_yaxes(title_text="残予算 (円)", row=1, col=1, secondary_y=True)
-                    fig3.update_yaxes(title_text="日別消化額 (円)", row=2, col=1)
-                    st.plotly_chart(fig3, use_container_width=True)
-
-                else:
-                    st.info("📊 グラフを表示するためのデータがありません。")
\ No newline at end of file
+                        use_dashboard(shared_cache.put(key_hash, start_date, end_date, dashboard, source='button'))
+
+# 6. スナップショット（取得したレポートと KPI テーブルを書き出し、API に問い合わせずに読み込み直す）
+with st.sidebar.expander("📦 スナップショット"):
+    uploaded_snapshot = st.file_uploader("スナップショット（zip）", type="zip")
+    # サーバーに保存済みのものは、入力中の API Key の組み合わせで保存したものだけを出す
+    snapshot_scope = pipeline.sources_hash(sources) if sources else None
+    saved_snapshots = snapshot.list_saved(snapshot_scope) if snapshot_scope else []
+    saved_snapshot = st.selectbox(
+        "サーバーに保存済み", saved_snapshots, index=None, format_func=os.path.basename,
+        placeholder="選択してください" if snapshot_scope else "API Key を入力してください", disabled=not saved_snapshots,
+    )
+    if st.button("スナップショットを読み込む", disabled=uploaded_snapshot is None and saved_snapshot is None):
+        try:
+            with run_metrics.stage('snapshot_load'):
+                frames, snapshot_meta = snapshot.load(uploaded_snapshot if uploaded_snapshot is not None else saved_snapshot)
+        except (OSError, ValueError, KeyError) as e:
+            st.error(f"スナップショットを読み込めません: {e}")
+        else:
+            dashboard = pipeline.build_dashboard(frames, snapshot_meta['start_date'], snapshot_meta['end_date'], run_metrics)
+            if dashboard is None:
+                st.session_state.pop('dashboard', None)
+                st.warning("スナップショットに配信実績データがありません。")
+            else:
+                dashboard['build_metrics'] = run_metrics.records()
+                dashboard['snapshot_created_at'] = snapshot_meta['created_at']
+                # API キーに紐づかないので共有キャッシュには入れない
+                use_dashboard({'dashboard': dashboard, 'built_at': time.time(), 'source': 'snapshot'})
+
+    if 'dashboard' in st.session_state:
+        export_dashboard = st.session_state['dashboard']
+        export_format = st.segmented_control("書き出し形式", list(snapshot.FORMATS), default='parquet')
+        if export_format:
+            period = f"{export_dashboard['start_date']:%Y%m%d}-{export_dashboard['end_date']:%Y%m%d}"
+            # ファイルはボタンが押されたときに作る（再実行のたびに書き出さない）
+            st.download_button(
+                "スナップショットをダウンロード", lambda: snapshot.archive_bytes(export_dashboard, export_format),
+                file_name=f"microad_snapshot_{period}_{export_format}.zip", mime="application/zip", on_click="ignore",
+            )
+            st.download_button(
+                "KPIテーブルをダウンロード", lambda: snapshot.table_bytes(export_dashboard['table_display_df'], export_format),
+                file_name=f"microad_kpi_{period}{snapshot.FORMATS[export_format]}", on_click="ignore",
+            )
+            if st.button(
+                "サーバーに保存", disabled=export_format == 'csv' or not snapshot_scope,
+                help="Arrow / Parquet のみ（読み込み時にメモリマップで開きます）。入力中の API Key の組み合わせの保存先に置きます",
+            ):
+                saved_path = snapshot.save(export_dashboard, snapshot_scope, export_format)
+                st.caption(f"{saved_path} に保存しました。")
+
+if 'dashboard' in st.session_state:
+    dashboard = st.session_state['dashboard']
+    # 各区画は取得時の期間で描画する（取得後にサイドバーの日付を変えても表示が食い違わないように）。
+    # 予測・アラート、詳細テーブル、グラフの操作ではその区画だけが再実行される
+    sections.summary_section(dashboard, trace_memory)
+    sections.alerts_section(dashboard, trace_memory)
+    sections.activity_section(dashboard, trace_memory)
+    sections.table_section(dashboard, trace_memory)
+    sections.graph_section(dashboard, trace_memory)
+
+# ========================================================
+# 🛠 計測結果の出力・デバッグ表示
+# ========================================================
+# セッションのメモリ使用量（集計結果は共有キャッシュ・他のセッションと同じものを参照している場合がある）
+if show_debug or metrics.LOG_ENABLED:
+    frame_cache = sections.session_cache()
+    run_metrics.values.update({
+        'session_id': st.session_state.setdefault('session_id', run_metrics.run_id),
+        'session_dashboard_mb': memory.nbytes(st.session_state.get('dashboard')) / 1024 / 1024,
+        'session_cache_mb': frame_cache.nbytes / 1024 / 1024,
+        'session_cache_entries': len(frame_cache),
+        'session_cache_evictions': frame_cache.evictions,
+    })
+run_metrics.emit()
+
+if show_debug:
+    session_values = run_metrics.values
+    st.sidebar.markdown("##### 🛠 セッションのメモリ")
+    st.sidebar.caption(
+        f"集計結果 {session_values['session_dashboard_mb']:,.1f} MB / "
+        f"派生データ {session_values['session_cache_mb']:,.1f} MB（{session_values['session_cache_entries']} 件・"
+        f"上限 {memory.SESSION_CACHE_MB:,.0f} MB・破棄 {session_values['session_cache_evictions']} 回） / "
+        f"プロセス最大 {metrics.max_rss_mb():,.0f} MB"
+    )
+
+    # 入力中の API Key の事前取得の状況（他のキーの状況は表示しない）
+    prefetch_status = {
+        sources[key]: prefetcher.status[pipeline.hash_api_key(key)]
+        for key in sources if pipeline.hash_api_key(key) in prefetcher.status
+    }
+    if prefetch_status:
+        st.sidebar.markdown("##### 🛠 事前取得の状況")
+        for label, status in prefetch_status.items():
+            finished_at = datetime.datetime.fromtimestamp(status['finished_at'])
+            result = f"エラー: {status['error']}" if status['error'] else "成功"
+            st.sidebar.caption(f"{label}: {finished_at:%H:%M} {result}（{status['seconds']:.1f}s）")
+
+    st.sidebar.markdown("##### 🛠 処理段階ごとの計測")
+    debug_records = run_metrics.records()
+    # データ取得を伴わない再実行では、直近の取得・集計時の計測も併せて表示する
+    if 'fetch' not in run_metrics.stages and 'dashboard' in st.session_state:
+        build_records = st.session_state['dashboard'].get('build_metrics', [])
+        debug_records = [dict(record, stage=f"{record['stage']}（取得時）") for record in build_records] + debug_records
+    # 区画ごとの描画の計測（fragment だけの再実行分は、次にスクリプト全体が再実行されたときに表示される）
+    if 'dashboard' in st.session_state:
+        for section_records in st.session_state.get('section_metrics', {}).values():
+            debug_records = debug_records + section_records
+    if debug_records:
+        st.sidebar.dataframe(
+            metrics.records_frame(debug_records),
+            hide_index=True,
+            column_config={
+                '秒': st.column_config.NumberColumn(format="%.3f"),
+                '行数': st.column_config.NumberColumn(format="localized"),
+                '受信バイト': st.column_config.NumberColumn(format="localized"),
+                '最大RSS(MB)': st.column_config.NumberColumn(format="%.1f"),
+                'ピーク(MB)': st.column_config.NumberColumn(format="%.1f"),
+            },
+        )
+    else:
+        st.sidebar.caption("計測結果はまだありません。")
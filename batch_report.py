@@ -0,0 +1,185 @@
+import argparse
+import concurrent.futures
+import datetime
+import importlib.util
+import os
+import re
+import sys
+import time
+
+import pandas as pd
+
+import charts
+import metrics
+import pipeline
+import report_parser
+import rollup
+import snapshot
+import table_view
+
+# バッチレポート（画面を使わない一括出力）
+# ダッシュボードと同じ取得・集計パイプラインで、アカウントごとにキャンペーン別テーブルと
+# 3 種類の分析グラフ（HTML / PNG）を書き出す。取得は 1 回だけ行い、アカウントごとの集計・出力を
+# プロセスプールに分散する。
+#   python batch_report.py --api-key KEY --output reports/20261016
+#   python batch_report.py --snapshot data/snapshots/<キーのハッシュ>/20261001-20261016_20261017010000_arrow_1a2b3c4d --format png --total
+# 出力: <output>/<アカウント>/table.csv・table.html・progress.html など、一覧は <output>/index.csv
+
+IMAGE_FORMATS = ['html', 'png']
+# HTML のグラフに plotly.js を埋め込まず CDN から読む（1 ファイル約 4MB の埋め込みを避ける）
+PLOTLYJS = os.environ.get("MICROAD_BATCH_PLOTLYJS", "cdn")
+TOTAL_NAME = "全アカウント"
+
+def safe_name(name):
+    # ファイル名に使えない文字を置き換える
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', str(name)).strip('_') or 'unknown'
+
+def split_accounts(frames, accounts=None):
+    # ReportFrames をアカウント単位に分ける（accounts: 対象のアカウント ID または名前。None なら全件）
+    campaigns = frames.campaigns.drop_duplicates('campaign_id', keep='last')
+    keys = rollup.account_keys(campaigns)
+    wanted = {str(account) for account in accounts} if accounts else None
+    jobs = {}
+    for key, account_campaigns in campaigns.groupby(keys.to_numpy(), sort=True):
+        name = account_campaigns['account_name'].iloc[0]
+        if wanted is not None and str(key) not in wanted and str(name) not in wanted:
+            continue
+        ids = account_campaigns['campaign_id']
+        jobs[f"{safe_name(key)}_{safe_name(name)}"] = report_parser.ReportFrames(
+            account_campaigns.reset_index(drop=True),
+            frames.limits.loc[frames.limits['campaign_id'].isin(ids)].reset_index(drop=True),
+            frames.records.loc[frames.records['campaign_id'].isin(ids)].reset_index(drop=True),
+        )
+    return jobs
+
+def write_table(dashboard, out_dir):
+    display_df = dashboard['table_display_df']
+    with open(os.path.join(out_dir, 'table.csv'), 'wb') as f:
+        snapshot.write_table(display_df, 'csv', f)
+    with open(os.path.join(out_dir, 'table.html'), 'w', encoding='utf-8') as f:
+        f.write(table_view.style_table(display_df, dashboard['budget_label']).hide(axis='index').to_html())
+
+def write_figures(dashboard, out_dir, image_format):
+    # 対象全体（アカウント単位の実行ならそのアカウントの合計）の 3 種類のグラフ
+    series = charts.prepare_series(dashboard['cube'], (rollup.LEVEL_TOTAL, None), dashboard['start_date'])
+    if series is None:
+        return
+    for chart_id, title in charts.CHART_TITLES.items():
+        fig = charts.build_figure(chart_id, series)
+        fig.update_layout(title=title)
+        path = os.path.join(out_dir, f"{chart_id}.{image_format}")
+        if image_format == 'html':
+            fig.write_html(path, include_plotlyjs=PLOTLYJS)
+        else:
+            fig.write_image(path, width=1200, height=600)
+
+def account_report(name, frames, start, end, out_dir, image_format):
+    # 1 アカウント分（または全体）の集計と書き出し。プロセスプールのワーカーで実行され、
+    # 失敗しても他のアカウントを止めないように結果の行として返す
+    started = time.perf_counter()
+    result = {'account': name, 'campaigns': len(frames.campaigns), 'path': out_dir}
+    try:
+        dashboard = pipeline.build_dashboard(frames, start, end)
+        if dashboard is None:
+            return dict(result, status='実績なし', seconds=time.perf_counter() - started)
+        os.makedirs(out_dir, exist_ok=True)
+        write_table(dashboard, out_dir)
+        write_figures(dashboard, out_dir, image_format)
+    except Exception as e:
+        return dict(result, status=f"エラー: {type(e).__name__}: {e}", seconds=time.perf_counter() - started)
+    summary = dashboard['summary']
+    return dict(
+        result, status='ok', budget=summary['total_budget'], gross=summary['total_gross'],
+        progress_percent=summary['total_gross'] / summary['total_budget'] * 100 if summary['total_budget'] else None,
+        standard_pacing=summary['standard_pacing'], seconds=time.perf_counter() - started,
+    )
+
+def run_reports(jobs, start, end, output, image_format, workers):
+    # jobs（名前 → ReportFrames）をプロセスプールで並列に処理し、完了順に進捗を表示する
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(account_report, name, frames, start, end, os.path.join(output, name), image_format)
+            for name, frames in jobs.items()
+        ]
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            result = future.result()
+            print(f"[{done}/{len(futures)}] {result['account']}: {result['status']} ({result['seconds']:.1f}s)", flush=True)
+            results.append(result)
+    return pd.DataFrame(results).sort_values('account', kind='stable').reset_index(drop=True)
+
+def load_frames(args, run_metrics):
+    # スナップショット指定ならそれを読み、なければ API から取得する（ローカルストアとの差分のみ）。
+    # 取得できなかった取得元（表示名 → 例外）も返す
+    if args.snapshot:
+        with run_metrics.stage('snapshot_load'):
+            frames, meta = snapshot.load(args.snapshot)
+        return frames, meta['start_date'], meta['end_date'], {}
+    # 複数の API Key は並列に取得してまとめる（失敗したキーは表示して除き、残りのキーで出力する）
+    # キーファイルは --keys-file を指定したときだけ読む（画面のチェックボックスと同じく明示したときだけまとめる）
+    sources = {key: pipeline.key_label(key) for key in pipeline.parse_keys(args.api_key)}
+    if args.keys_file:
+        sources.update(pipeline.read_keys_file(args.keys_file))
+
+    def fetch(api_key):
+        return pipeline.sync_report(
+            pipeline.hash_api_key(api_key), args.start, args.end,
+            lambda start, end: pipeline.fetch_report(api_key, start, end), args.refetch_days,
+        )
+
+    with run_metrics.stage('fetch', sources=len(sources)) as stage:
+        frames, errors = pipeline.fetch_sources(sources, fetch)
+        stage['rows'] = 0 if frames is None else len(frames.records)
+    for label, e in errors.items():
+        print(f"取得エラー（{label}）: {e}", file=sys.stderr)
+    return frames, args.start, args.end, errors
+
+def main():
+    default_start, default_end = pipeline.default_range()
+    parser = argparse.ArgumentParser(description="アカウントごとのキャンペーン別テーブルと分析グラフを一括出力する")
+    parser.add_argument("--api-key", default=os.environ.get("MICROAD_API_KEY"), help="カンマ区切りで複数指定可。既定は環境変数 MICROAD_API_KEY")
+    parser.add_argument("--keys-file", help="まとめて取得する API Key のファイル（MICROAD_API_KEYS_FILE と同じ形式。指定したときだけ読む）")
+    parser.add_argument("--snapshot", help="API の代わりに読み込むスナップショット（zip または保存先ディレクトリ）")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=default_start)
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=default_end)
+    parser.add_argument("--refetch-days", type=int, default=2, help="取得済みでも取り直す直近の日数")
+    parser.add_argument("--accounts", nargs="+", help="対象のアカウント ID または名前（既定は全アカウント）")
+    parser.add_argument("--total", action="store_true", help=f"全アカウント合計のレポート（{TOTAL_NAME}）も出力する")
+    parser.add_argument("--format", choices=IMAGE_FORMATS, default='html', help="グラフの形式（png は kaleido が必要）")
+    parser.add_argument("--output", default=os.path.join("reports", datetime.date.today().strftime("%Y%m%d")))
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="並列に処理するプロセス数")
+    args = parser.parse_args()
+    if not args.api_key and not args.keys_file and not args.snapshot:
+        parser.error("--api-key（または MICROAD_API_KEY）・--keys-file・--snapshot のいずれかを指定してください")
+    if args.format == 'png' and importlib.util.find_spec('kaleido') is None:
+        parser.error("PNG の書き出しには kaleido が必要です（pip install kaleido）")
+
+    run_metrics = metrics.RunMetrics(prefix='batch_')
+    frames, start, end, fetch_errors = load_frames(args, run_metrics)
+    if frames is None:
+        return 1
+    jobs = split_accounts(frames, args.accounts)
+    if args.total:
+        jobs[TOTAL_NAME] = frames
+    if not jobs:
+        print("対象のアカウントがありません。", file=sys.stderr)
+        return 1
+
+    print(f"{start} 〜 {end}: {len(jobs)} 件を {args.workers} プロセスで出力します → {args.output}", flush=True)
+    with run_metrics.stage('reports', rows=len(jobs)) as stage:
+        results = run_reports(jobs, start, end, args.output, args.format, args.workers)
+    stage_seconds = stage['seconds']
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, 'index.csv'), 'wb') as f:
+        snapshot.write_table(results, 'csv', f)
+    run_metrics.emit()
+
+    failed = results['status'].str.startswith('エラー')
+    print(f"完了: {len(results) - failed.sum()} 件 / エラー {failed.sum()} 件（{stage_seconds:.1f}s）")
+    if fetch_errors:
+        print(f"取得できなかった API Key: {' / '.join(fetch_errors)}", file=sys.stderr)
+    # 一部の取得元が取得できなかった場合も、出力は不完全なので失敗として終了する
+    return 1 if failed.any() or fetch_errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
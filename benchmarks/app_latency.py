@@ -0,0 +1,102 @@
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_server import StubServer
+from benchmarks.synthetic import SyntheticReport
+
+# 画面の起動・操作の応答時間
+# Streamlit の AppTest で app.py を実行し、合成レポートをローカルのスタブサーバーから取得して計測する。
+#   python -m benchmarks.app_latency --campaigns 1000 --repeat 5 --output latency.jsonl
+# cold_start: 新しいプロセスで Streamlit の読み込みから初回描画（データなし）まで
+# rerun_*: 操作 1 回ごとのスクリプト全体の再実行（AppTest は fragment だけの再実行を行わない）
+# section_*: 区画ごとの描画時間。fragment の区画の操作は、ブラウザではこの区画だけが再実行される
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+COLD_START_CODE = """
+import sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.run()
+print(time.perf_counter() - started)
+"""
+
+def cold_start(repeat):
+    times = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", COLD_START_CODE, APP_PATH], capture_output=True, text=True, check=True)
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return times
+
+def timed(action):
+    started = time.perf_counter()
+    action()
+    return time.perf_counter() - started
+
+def widget(elements, label):
+    return next(element for element in elements if element.label == label)
+
+def section_seconds(at):
+    # 直近の実行での区画ごとの描画時間（区画ごとの計測がない版では空）
+    if 'section_metrics' not in at.session_state:
+        return {}
+    return {
+        record['stage']: record['seconds']
+        for records in at.session_state['section_metrics'].values() for record in records
+        if record['stage'].startswith('render_')
+    }
+
+def interactions(campaigns, repeat, seed):
+    report = SyntheticReport(campaigns, seed=seed)
+    with StubServer(report, seed=seed) as server, tempfile.TemporaryDirectory() as tmp:
+        # app.py の読み込み前に設定する（取得先・ローカルストアは import 時に決まる）
+        os.environ['MICROAD_API_URL'] = server.url
+        os.environ['MICROAD_STORE_PATH'] = os.path.join(tmp, "store.sqlite3")
+        from streamlit.testing.v1 import AppTest
+        at = AppTest.from_file(APP_PATH, default_timeout=600)
+        at.run()
+        at.sidebar.text_input[0].input("bench")
+        result = {'fetch': timed(lambda: widget(at.sidebar.button, "データ取得").click().run())}
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+
+        runs = {'rerun_graph_select': [], 'rerun_burn_window': []}
+        sections = {}
+        options = widget(at.selectbox, "グラフを表示する対象を選択").options
+        for i in range(repeat):
+            option = options[1 + i % (len(options) - 1)]
+            runs['rerun_graph_select'].append(timed(lambda: widget(at.selectbox, "グラフを表示する対象を選択").select(option).run()))
+            for stage, seconds in section_seconds(at).items():
+                sections.setdefault(f"section_{stage[len('render_'):]}", []).append(seconds)
+            runs['rerun_burn_window'].append(timed(lambda: widget(at.number_input, "消化ペースの集計日数（直近）").set_value(1 + i % 14).run()))
+        result.update({name: statistics.median(times) for name, times in runs.items()})
+        result.update({name: statistics.median(times) for name, times in sections.items()})
+        return result
+
+def main():
+    parser = argparse.ArgumentParser(description="画面の起動・操作の応答時間")
+    parser.add_argument("--campaigns", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果を JSON Lines で追記するファイル")
+    args = parser.parse_args()
+
+    result = {'campaigns': args.campaigns, 'cold_start': statistics.median(cold_start(args.repeat))}
+    result.update(interactions(args.campaigns, args.repeat, args.seed))
+    for name, seconds in result.items():
+        print(f"{name:<28} {seconds:>10.3f}" if name != 'campaigns' else f"{name:<28} {seconds:>10,}")
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), **result}, ensure_ascii=False) + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import argparse
+import datetime
+import json
+import platform
+import sys
+import tempfile
+
+import pandas as pd
+
+import charts
+import kpi
+import metrics
+import microad_api
+import pipeline
+import report_parser
+import rollup
+import table_view
+from benchmarks.stub_server import StubServer
+from benchmarks.synthetic import SyntheticReport, parse_size
+
+# ダッシュボードの処理段階ごとのベンチマーク
+# 合成レポートをローカルのスタブサーバーから取得し、取得 → パース → マスタ作成 → 集計 → 前日比 →
+# テーブル書式 → グラフ作成の各段階の処理時間とピークメモリを計測する（ネットワーク不要）。
+#   python -m benchmarks.run --sizes 10x7 1000x31 50000x31 --latency 0.05 --error-rate 0.1 --output bench.jsonl
+# 処理時間はメモリ計測なしで測り、ピークメモリは tracemalloc を有効にした 2 回目の実行で段階ごとに測る。
+
+DEFAULT_SIZES = ['10x7', '1000x31', '50000x31', 'single_account']
+READ_CHUNK_SIZE = 64 * 1024
+
+def parse_legacy(body):
+    # 比較用: 元のダッシュボードのパース（本文全体を辞書に展開し、辞書のリストから DataFrame を作って列ごとに型変換）
+    data = json.loads(body)
+    campaigns = []
+    for acc in data.get('account') or []:
+        for camp in acc.get('campaign') or []:
+            campaigns.append({
+                'campaign_id': camp['id'], 'account_name': acc.get('name', 'Unknown'), 'campaign_name': camp['name'],
+                'limits': camp.get('campaign_monthly_charge_limit') or [],
+            })
+    master_df = pd.DataFrame(campaigns)
+    perf_df = pd.DataFrame((data.get('report') or {}).get('records') or [])
+    for col in ['net', 'gross', 'impression', 'click']:
+        if col in perf_df.columns:
+            perf_df[col] = pd.to_numeric(perf_df[col], errors='coerce').fillna(0)
+    if 'target_date' in perf_df.columns:
+        perf_df['target_date'] = pd.to_datetime(perf_df['target_date'].astype(str))
+    return master_df, perf_df
+
+def run_pipeline(report, url, start, end, timer):
+    # ダッシュボードの「データ取得」1 回分と同じ処理を段階ごとに計測する
+    with timer.stage('fetch') as stage:
+        with microad_api.MicroAdClient("bench", base_url=url, backoff=0.05) as client:
+            fetched = client.fetch_range(start, end)
+        stage.update(rows=len(fetched.records), requests=client.requests_sent, response_bytes=client.bytes_received)
+
+    # パースは本文を一時ファイルに書き出し、ネットワークなしでチャンク読みする
+    with tempfile.TemporaryFile() as body:
+        for chunk in report.iter_json_chunks(start, end):
+            body.write(chunk)
+        body.seek(0)
+        with timer.stage('parse'):
+            frames = report_parser.parse_stream(iter(lambda: body.read(READ_CHUNK_SIZE), b''))
+        # 元のパースとの比較。最大RSS はプロセスで単調増加なので、こちらを後に測る
+        body.seek(0)
+        with timer.stage('parse_legacy'):
+            parse_legacy(body.read())
+
+    months = kpi.month_calendar(start, end)['month'].tolist()
+    with timer.stage('master'):
+        master_df = report_parser.build_master(frames.campaigns, frames.limits, months)
+
+    with timer.stage('aggregation'):
+        cube = rollup.RollupCube(frames.records, master_df, frames.limits, months)
+        monthly_df = kpi.monthly_kpis(cube.campaign_daily, master_df, frames.limits, start, end)
+
+    with timer.stage('day_over_day'):
+        kpi.daily_diff(cube.campaign_daily)
+
+    with timer.stage('campaign_kpis'):
+        merged_df = kpi.campaign_kpis(cube.campaign_daily, master_df, monthly_df)
+        kpi.summary(merged_df, monthly_df, start, end)
+
+    with timer.stage('exhaustion_forecast'):
+        pipeline.exhaustion_alerts({'cube': cube, 'master_df': master_df, 'start_date': start, 'end_date': end})
+
+    budget_label = pipeline.budget_column_label(months)
+    with timer.stage('table_fast'):
+        display_df = table_view.display_table(merged_df, budget_label)
+        page_df, _, _ = table_view.paginate(table_view.sort_table(display_df, '乖離(pt)'), 1, table_view.PAGE_SIZES[1])
+
+    with timer.stage('table_styling'):
+        table_view.style_table(display_df, budget_label).to_html()
+
+    # 全体合計と先頭キャンペーンの 3 グラフ
+    with timer.stage('figures'):
+        for option in [(rollup.LEVEL_TOTAL, None), (rollup.LEVEL_CAMPAIGN, master_df['campaign_id'].iloc[0])]:
+            series = charts.prepare_series(cube, option, start)
+            if series is not None:
+                for chart_id in charts.CHART_TITLES:
+                    charts.build_figure(chart_id, series)
+
+    return {'records': len(fetched.records), 'campaigns': len(master_df), 'rows': len(display_df)}
+
+def benchmark(size, end, latency, error_rate, trace_memory, seed):
+    campaigns, days, campaigns_per_account = parse_size(size)
+    start = end - datetime.timedelta(days=days - 1)
+    report = SyntheticReport(campaigns, campaigns_per_account, seed=seed)
+    results = []
+    passes = [False, True] if trace_memory else [False]
+    for traced in passes:
+        timer = metrics.RunMetrics(trace_memory=traced)
+        with StubServer(report, latency=latency, error_rate=error_rate, seed=seed) as stub:
+            counts = run_pipeline(report, stub.url, start, end, timer)
+        results.append((timer.stages, counts, dict(stub.stats)))
+
+    stages, counts, stats = results[0]
+    if trace_memory:
+        for name, traced in results[1][0].items():
+            stages[name]['peak_mb'] = traced['peak_mb']
+    return {
+        'size': size, 'campaigns': campaigns, 'days': days, 'campaigns_per_account': campaigns_per_account,
+        'start': start.isoformat(), 'end': end.isoformat(),
+        'latency': latency, 'error_rate': error_rate,
+        **counts, 'requests': stats['requests'], 'injected_errors': stats['errors'],
+        'stages': stages,
+    }
+
+def print_result(result):
+    print(f"\n## {result['size']}  ({result['campaigns']:,} campaigns x {result['days']} days, "
+          f"{result['campaigns_per_account']:,} per account, "
+          f"{result['records']:,} records, {result['requests']} requests / {result['injected_errors']} injected errors)")
+    table = metrics.records_frame([{'stage': name, **entry} for name, entry in result['stages'].items()])
+    print(table.to_string(index=False, na_rep='-', float_format=lambda value: f"{value:,.3f}"))
+
+def main():
+    parser = argparse.ArgumentParser(description="ダッシュボードの処理段階ごとのベンチマーク")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="キャンペーン数x日数[x1アカウントあたりのキャンペーン数] または small / medium / large / single_account")
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=datetime.date.today() - datetime.timedelta(days=1))
+    parser.add_argument("--latency", type=float, default=0.0, help="スタブの応答遅延（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="スタブが 429 / 503 を返す割合")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="tracemalloc によるピークメモリ計測を省く")
+    parser.add_argument("--output", help="結果を JSON Lines で追記するファイル")
+    args = parser.parse_args()
+
+    environment = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(), 'pandas': pd.__version__, 'platform': platform.platform(),
+    }
+    for size in args.sizes:
+        result = benchmark(size, args.end, args.latency, args.error_rate, not args.no_memory, args.seed)
+        print_result(result)
+        if args.output:
+            with open(args.output, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({**environment, **result}, ensure_ascii=False) + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
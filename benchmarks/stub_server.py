@@ -0,0 +1,149 @@
+import argparse
+import datetime
+import json
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.synthetic import SyntheticReport
+
+# /v2/reports のスタブサーバー
+# 合成レポートを chunked で返す。応答の遅延と、一定の割合での 429 / 5xx（Retry-After 付き）を注入できる。
+# ダッシュボードを向ける場合: python -m benchmarks.stub_server --campaigns 1000 --port 8080
+#   MICROAD_API_URL=http://127.0.0.1:8080/v2/reports streamlit run app.py
+
+REPORT_PATH = "/v2/reports"
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_empty(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        stub = self.server.stub
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        stub.count("requests")
+
+        if urllib.parse.urlsplit(self.path).path != REPORT_PATH:
+            self._send_empty(404)
+            return
+        if not self.headers.get("x-api-key"):
+            self._send_empty(401)
+            return
+        try:
+            params = json.loads(body)
+            start = datetime.datetime.strptime(params["start_date"], "%Y%m%d").date()
+            end = datetime.datetime.strptime(params["end_date"], "%Y%m%d").date()
+        except (ValueError, KeyError, TypeError):
+            self._send_empty(400)
+            return
+
+        if stub.latency:
+            time.sleep(stub.latency)
+        status = stub.injected_error()
+        if status:
+            stub.count("errors")
+            self._send_empty(status, {"Retry-After": f"{stub.retry_after:g}"})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in stub.report.iter_json_chunks(start, end):
+            self.wfile.write(f"{len(chunk):X}\r\n".encode("ascii") + chunk + b"\r\n")
+            stub.count("bytes", len(chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # クライアントが keep-alive の接続を閉じただけのものは無視する
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+class StubServer:
+    def __init__(self, report, latency=0.0, error_rate=0.0, error_statuses=(429, 503), retry_after=0.05,
+                 seed=0, host="127.0.0.1", port=0):
+        self.report = report
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.retry_after = retry_after
+        self.stats = {"requests": 0, "errors": 0, "bytes": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{REPORT_PATH}"
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+    def injected_error(self):
+        # error_rate の確率でエラーのステータスを返す（エラーにしない場合は None）
+        with self._lock:
+            if self._random.random() < self.error_rate:
+                return self._random.choice(self.error_statuses)
+        return None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        # 呼び出したスレッドで待ち受ける（Ctrl+C で終了）
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="MicroAd レポート API のスタブサーバー")
+    parser.add_argument("--campaigns", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="応答までの遅延（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="429 / 503 を返す割合")
+    args = parser.parse_args()
+
+    report = SyntheticReport(args.campaigns, seed=args.seed)
+    server = StubServer(report, latency=args.latency, error_rate=args.error_rate, seed=args.seed, host=args.host, port=args.port)
+    print(f"serving {args.campaigns} campaigns at {server.url}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import calendar
+import datetime
+import json
+
+import numpy as np
+
+# 合成レポート
+# MicroAd レポート API（/v2/reports）と同じ形のレスポンス
+# （account[].campaign[].campaign_monthly_charge_limit と report.records）を任意の件数で生成する。
+# 実績は (シード, 日付) ごとに決まる乱数で作るので、どのウィンドウで要求しても同じ日の値は同じになる。
+
+CAMPAIGNS_PER_ACCOUNT = 20
+
+# ベンチマークの規模（キャンペーン数 × 日数 × 1 アカウントあたりのキャンペーン数）
+PRESETS = {
+    'small': (10, 7, CAMPAIGNS_PER_ACCOUNT),
+    'medium': (1000, 31, CAMPAIGNS_PER_ACCOUNT),
+    'large': (50000, 365, CAMPAIGNS_PER_ACCOUNT),
+    # 1 アカウントに全キャンペーンが入る形（アカウント単位の処理が大きくなる場合の確認用）
+    'single_account': (20000, 7, 20000),
+}
+FIRST_CAMPAIGN_ID = 100001
+
+# 曜日ごとの配信量の係数（月〜日）
+WEEKDAY_FACTORS = np.array([1.0, 1.05, 1.05, 1.0, 0.95, 0.8, 0.75])
+
+def parse_size(text):
+    # "small" / "1000x31" / "20000x7x20000" を (キャンペーン数, 日数, 1 アカウントあたりのキャンペーン数) に変換する
+    if text in PRESETS:
+        return PRESETS[text]
+    parts = [int(part) for part in text.lower().split('x')]
+    campaigns, days = parts[:2]
+    return campaigns, days, parts[2] if len(parts) > 2 else CAMPAIGNS_PER_ACCOUNT
+
+def _months(start, end):
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+class SyntheticReport:
+    def __init__(self, campaigns, campaigns_per_account=CAMPAIGNS_PER_ACCOUNT, seed=0):
+        self.campaigns = campaigns
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+
+        # キャンペーンごとの配信規模・CTR・CPM・予算の余裕度・配信のない日の割合
+        self.campaign_ids = np.arange(FIRST_CAMPAIGN_ID, FIRST_CAMPAIGN_ID + campaigns)
+        self.account_index = np.arange(campaigns) // campaigns_per_account
+        self.base_imp = rng.lognormal(mean=8.5, sigma=1.2, size=campaigns)
+        self.ctr = rng.uniform(0.001, 0.02, size=campaigns)
+        self.cpm = rng.uniform(80, 600, size=campaigns)
+        self.budget_factor = rng.uniform(0.7, 1.4, size=campaigns)
+        self.idle_rate = rng.choice([0.0, 0.05, 0.3], p=[0.7, 0.2, 0.1], size=campaigns)
+
+    def monthly_limit(self, year, month):
+        # 想定消化額 × 余裕度を 1,000 円単位に丸めた月別予算
+        days = calendar.monthrange(year, month)[1]
+        expected = self.base_imp * self.cpm / 1000 * days * self.budget_factor
+        return np.round(expected, -3)
+
+    def accounts(self, start, end):
+        # 期間にかかる月の月別予算を付けたアカウント → キャンペーンのマスタ
+        limits = [(f"{year}{month:02d}", self.monthly_limit(year, month).tolist()) for year, month in _months(start, end)]
+        accounts = []
+        for i, camp_id in enumerate(self.campaign_ids.tolist()):
+            acc = int(self.account_index[i])
+            if not accounts or accounts[-1]['id'] != acc + 1:
+                accounts.append({'id': acc + 1, 'name': f"アカウント{acc + 1:04d}", 'campaign': []})
+            accounts[-1]['campaign'].append({
+                'id': camp_id,
+                'name': f"キャンペーン{camp_id}",
+                'campaign_monthly_charge_limit': [{'month': month, 'charge_limit': values[i]} for month, values in limits],
+            })
+        return accounts
+
+    def day_records(self, day):
+        # 1 日分の実績（配信のあったキャンペーンのみ）を配列で返す
+        rng = np.random.default_rng([self.seed, day.toordinal()])
+        active = rng.random(self.campaigns) >= self.idle_rate
+        imp = rng.poisson(self.base_imp * WEEKDAY_FACTORS[day.weekday()] * rng.uniform(0.7, 1.3, self.campaigns))
+        click = rng.binomial(imp, self.ctr)
+        gross = np.round(imp * self.cpm / 1000, 1)
+        mask = active & (imp > 0)
+        return self.campaign_ids[mask], gross[mask], imp[mask], click[mask]
+
+    def iter_json_chunks(self, start, end):
+        # レスポンス本文を日単位のバイト列チャンクで返す（本文全体をメモリに持たない）
+        yield b'{"account":' + json.dumps(self.accounts(start, end), ensure_ascii=False).encode('utf-8')
+        yield b',"report":{"records":['
+        first = True
+        day = start
+        while day <= end:
+            ids, gross, imp, click = self.day_records(day)
+            date_text = day.strftime('%Y%m%d')
+            # 数値は API と同じく文字列と数値が混在する
+            records = ','.join([
+                f'{{"campaign_id":{c},"target_date":"{date_text}","net":"{g * 0.8:.1f}","gross":"{g:.1f}","impression":{i},"click":{k}}}'
+                for c, g, i, k in zip(ids.tolist(), gross.tolist(), imp.tolist(), click.tolist())
+            ])
+            if records:
+                yield (b'' if first else b',') + records.encode('utf-8')
+                first = False
+            day += datetime.timedelta(days=1)
+        yield b']}}'
+
+    def payload(self, start, end):
+        return json.loads(b''.join(self.iter_json_chunks(start, end)))
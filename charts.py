@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+import kpi
+
+# 詳細分析グラフ
+# 対象ごとの系列（実績・理想線・予測）と組み立てたグラフは呼び出し側でキャッシュして使い回す。
+# 点数の多い系列は WebGL（Scattergl）で描画し、必要に応じて間引いて表示する。
+
+# 1 系列の点数がこれを超えたら Scattergl に切り替える
+WEBGL_THRESHOLD = 500
+# 間引き表示の 1 系列あたりの最大点数
+DOWNSAMPLE_POINTS = 400
+
+CHART_PROGRESS = 'progress'
+CHART_EFFICIENCY = 'efficiency'
+CHART_BUDGET = 'budget'
+
+CHART_TITLES = {
+    CHART_PROGRESS: "① 予算・ボリューム分析（進捗 & Click）",
+    CHART_EFFICIENCY: "② 効率・品質分析（CTR & CPM）",
+    CHART_BUDGET: "③ 予算管理分析（Gross & Budget）",
+}
+
+def prepare_series(cube, option, start_date):
+    # 対象（(レベル, ID)）の日別系列・理想線・予測をまとめて計算する（実績が無ければ None）
+    target_data = cube.series(*option)
+    if target_data.empty:
+        return None
+    budget = cube.budget(*option)
+    target_data = kpi.series_kpis(target_data, budget)
+    ideal_df = kpi.ideal_line(cube.monthly_budgets(*option))
+
+    # 予測・挽回計算（期間最終月の月末まで）
+    latest_row = target_data.iloc[-1]
+    forecast_df = kpi.forecast(
+        pd.DataFrame({
+            'latest_date': [latest_row['target_date']],
+            'cum_gross': [latest_row['cum_gross']],
+            'cum_click': [latest_row['cum_click']],
+            'budget': [budget],
+        }),
+        start_date, ideal_df['date'].max(),
+    )
+    return {'target_data': target_data, 'ideal_df': ideal_df, 'forecast_df': forecast_df, 'budget': budget}
+
+def downsample(df, max_points=DOWNSAMPLE_POINTS):
+    # 先頭と末尾を残して等間隔に間引く
+    if len(df) <= max_points:
+        return df
+    positions = np.unique(np.linspace(0, len(df) - 1, max_points).round().astype(int))
+    return df.iloc[positions]
+
+def _scatter_type(*frames):
+    # 最も長い系列の点数で Scatter / Scattergl を選ぶ
+    if max(len(df) for df in frames) > WEBGL_THRESHOLD:
+        return go.Scattergl
+    return go.Scatter
+
+def progress_figure(target_data, ideal_df, forecast_df, budget):
+    # グラフ1：進捗・ボリューム分析
+    scatter = _scatter_type(target_data, ideal_df, forecast_df)
+    fig = make_subplots(
+        rows=3, cols=1, 
+        shared_xaxes=True, 
+        vertical_spacing=0.08,
+        subplot_titles=(f"進捗率の推移", f"累積Click推移", f"日別Click推移"),
+        specs=[[{"secondary_y": False}], [{"secondary_y": True}], [{"secondary_y": True}]]
+    )
+    fig.add_trace(scatter(x=ideal_df['date'], y=ideal_df['ideal_progress'], mode='lines', name='理想線', line=dict(color='lightgray', dash='dot')), row=1, col=1)
+    fig.add_trace(scatter(x=target_data['target_date'], y=target_data['actual_progress'], mode='lines+markers', name='実績', line=dict(color='red', width=3)), row=1, col=1)
+    if not forecast_df.empty:
+        fig.add_trace(scatter(x=forecast_df['date'], y=forecast_df['forecast_progress'], mode='lines', name='予測(現状維持)', line=dict(color='green', dash='dot')), row=1, col=1)
+        fig.add_trace(scatter(x=forecast_df['date'], y=forecast_df['recovery_progress'], mode='lines', name='必要ペース', line=dict(color='deeppink', dash='dot')), row=1, col=1)
+
+    fig.add_trace(scatter(x=ideal_df['date'], y=ideal_df['ideal_cum_click'], name='理想累積(CPC100円)', mode='lines', line=dict(color='lightgray', dash='dot')), row=2, col=1, secondary_y=True)
+    fig.add_trace(scatter(x=target_data['target_date'], y=target_data['cum_click'], name='実績累積Click', mode='lines+markers', line=dict(color='orange', width=2)), row=2, col=1, secondary_y=True)
+    if not forecast_df.empty:
+        fig.add_trace(scatter(x=forecast_df['date'], y=forecast_df['forecast_cum_click'], name='予測累積Click', mode='lines', line=dict(color='green', dash='dot')), row=2, col=1, secondary_y=True)
+        fig.add_trace(scatter(x=forecast_df['date'], y=forecast_df['recovery_cum_click'], name='必要累積Click', mode='lines', line=dict(color='deeppink', dash='dot')), row=2, col=1, secondary_y=True)
+    fig.add_trace(go.Bar(x=target_data['target_date'], y=target_data['cum_imp'], name='実績累積IMP', opacity=0.1, marker_color='gray'), row=2, col=1, secondary_y=False)
+
+    fig.add_trace(scatter(x=target_data['target_date'], y=target_data['click'], name='日別Click', mode='lines+markers', line=dict(color='navy', width=2)), row=3, col=1, secondary_y=True)
+    fig.add_trace(scatter(x=ideal_df['date'], y=ideal_df['ideal_daily_click'], name='理想日別(CPC100円)', mode='lines', line=dict(color='lightgray', dash='dot')), row=3, col=1, secondary_y=True)
+    if not forecast_df.empty:
+        fig.add_trace(scatter(x=forecast_df['date'], y=forecast_df['req_daily_click'], name='明日からの必要数', mode='lines', line=dict(color='deeppink', dash='dot', width=2)), row=3, col=1, secondary_y=True)
+    fig.add_trace(go.Bar(x=target_data['target_date'], y=target_data['impression'], name='日別IMP', opacity=0.4, marker_color='lightblue'), row=3, col=1, secondary_y=False)
+
+    fig.update_layout(height=900, showlegend=True, hovermode="x unified")
+    fig.update_yaxes(title_text="進捗率 (%)", range=[0, 110], row=1, col=1)
+    fig.update_yaxes(title_text="累積IMP", row=2, col=1, secondary_y=False)
+    fig.update_yaxes(title_text="累積Click", row=2, col=1, secondary_y=True)
+    fig.update_yaxes(title_text="日別IMP", row=3, col=1, secondary_y=False)
+    fig.update_yaxes(title_text="日別Click", row=3, col=1, secondary_y=True)
+    return fig
+
+def efficiency_figure(target_data, ideal_df, forecast_df, budget):
+    # グラフ2：効率・品質分析
+    scatter = _scatter_type(target_data, ideal_df, forecast_df)
+    fig = make_subplots(
+        rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.1,
+        subplot_titles=(f"CTR(クリック率)推移", f"コスト効率分析 [CPM vs CTR]"),
+        specs=[[{"secondary_y": False}], [{"secondary_y": True}]]
+    )
+    fig.add_trace(scatter(x=target_data['target_date'], y=target_data['daily_ctr'], name='日別CTR', mode='lines+markers', line=dict(color='blue', width=2)), row=1, col=1)
+    fig.add_trace(scatter(x=target_data['target_date'], y=target_data['cum_ctr'], name='累計CTR', mode='lines', line=dict(color='orange', dash='dot', width=2)), row=1, col=1)
+
+    fig.add_trace(go.Bar(x=target_data['target_date'], y=target_data['daily_cpm'], name='日別CPM', opacity=0.6, marker_color='purple'), row=2, col=1, secondary_y=False)
+    fig.add_trace(scatter(x=target_data['target_date'], y=target_data['daily_ctr'], name='日別CTR', mode='lines+markers', line=dict(color='blue', width=2)), row=2, col=1, secondary_y=True)
+
+    fig.update_layout(height=700, showlegend=True, hovermode="x unified")
+    fig.update_yaxes(title_text="CTR (%)", row=1, col=1)
+    fig.update_yaxes(title_text="CPM (円)", row=2, col=1, secondary_y=False)
+    fig.update_yaxes(title_text="CTR (%)", row=2, col=1, secondary_y=True)
+    return fig
+
+def budget_figure(target_data, ideal_df, forecast_df, budget):
+    # グラフ3：予算管理分析（Gross & Budget）
+    scatter = _scatter_type(target_data, ideal_df, forecast_df)
+    fig = make_subplots(
+        rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.1,
+        subplot_titles=(f"累積消化額 vs 残予算の推移", f"日別消化額の推移"),
+        specs=[[{"secondary_y": True}], [{"secondary_y": False}]]
+    )
+
+    # 上段: 累積消化(面) vs 残予算(線)
+    fig.add_trace(scatter(x=target_data['target_date'], y=target_data['cum_gross'], name='累積消化額', mode='lines', fill='tozeroy', line=dict(color='royalblue')), row=1, col=1, secondary_y=False)
+    fig.add_trace(scatter(x=target_data['target_date'], y=target_data['remaining_budget'], name='残予算', mode='lines', line=dict(color='mediumseagreen', width=3)), row=1, col=1, secondary_y=True)
+    # 予算上限ライン
+    fig.add_trace(scatter(x=[target_data['target_date'].min(), target_data['target_date'].max()], y=[budget, budget], name='予算上限', mode='lines', line=dict(color='red', dash='dot')), row=1, col=1, secondary_y=False)
+
+    # 下段: 日別消化
+    fig.add_trace(go.Bar(x=target_data['target_date'], y=target_data['gross'], name='日別消化額', marker_color='royalblue'), row=2, col=1)
+    # 日割り目安
+    fig.add_trace(scatter(x=ideal_df['date'], y=ideal_df['ideal_daily_gross'], name='日割り目安', mode='lines', line=dict(color='gray', dash='dot')), row=2, col=1)
+
+    fig.update_layout(height=700, showlegend=True, hovermode="x unified")
+    fig.update_yaxes(title_text="累積消化額 (円)", row=1, col=1, secondary_y=False)
+    fig.update_yaxes(title_text="残予算 (円)", row=1, col=1, secondary_y=True)
+    fig.update_yaxes(title_text="日別消化額 (円)", row=2, col=1)
+    return fig
+
+CHART_BUILDERS = {
+    CHART_PROGRESS: progress_figure,
+    CHART_EFFICIENCY: efficiency_figure,
+    CHART_BUDGET: budget_figure,
+}
+
+def build_figure(chart_id, series, use_downsample=False):
+    target_data, ideal_df, forecast_df = series['target_data'], series['ideal_df'], series['forecast_df']
+    if use_downsample:
+        target_data, ideal_df, forecast_df = downsample(target_data), downsample(ideal_df), downsample(forecast_df)
+    return CHART_BUILDERS[chart_id](target_data, ideal_df, forecast_df, series['budget'])
@@ -0,0 +1,313 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+# KPI 計算エンジン
+# 進捗・CTR・CPM・前日比・予測の計算をまとめたもの。Streamlit に依存しないので
+# ダッシュボードからもバッチ処理からも呼び出せる。すべて全キャンペーン・全日付に対して一括で計算する。
+
+NUMERIC_COLS = ['net', 'gross', 'impression', 'click']
+DAILY_COLS = ['gross', 'impression', 'click']
+
+# 理想線・必要ペースの Click 換算に使う想定CPC（円）
+TARGET_CPC = 100
+
+# 予算枯渇予測の消化ペースに使う直近日数
+BURN_WINDOW_DAYS = 7
+# 着地予測進捗率(%) がこれを下回る対象を未達見込みとする
+UNDER_DELIVERY_THRESHOLD = 90
+
+RISK_OVER = '🟥前倒し枯渇'
+RISK_UNDER = '🟨未達見込み'
+
+DAILY_DIFF_COLUMNS = [
+    'campaign_id', 'latest_gross', 'diff_gross',
+    'latest_imp', 'diff_imp', 'latest_click', 'diff_click',
+    'latest_ctr', 'diff_ctr'
+]
+
+def safe_divide(numerator, denominator, scale=1):
+    # 分母が 0 以下（または欠損）の要素は 0 を返す割り算
+    num = np.asarray(numerator, dtype=float)
+    den = np.asarray(denominator, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.where(den > 0, num / den * scale, 0.0)
+    if isinstance(numerator, pd.Series):
+        return pd.Series(result, index=numerator.index)
+    if result.ndim == 0:
+        return float(result)
+    return result
+
+def month_calendar(start_date, end_date):
+    # 期間にかかる各月の日数・経過日数・理想進捗率。
+    # 経過日数は月初から min(終了日, 月末) まで、実績の観測日数は max(開始日, 月初) から数える
+    months = pd.period_range(start_date, end_date, freq='M')
+    month_start = months.start_time
+    month_end = months.end_time.normalize()
+    as_of = np.minimum(month_end, pd.Timestamp(end_date))
+    first_day = np.maximum(month_start, pd.Timestamp(start_date))
+    days_in_month = np.asarray(months.days_in_month)
+    elapsed_days = np.asarray(as_of.day)
+    return pd.DataFrame({
+        'month': months.strftime('%Y%m'),
+        'month_start': month_start,
+        'month_end': month_end,
+        'days_in_month': days_in_month,
+        'elapsed_days': elapsed_days,
+        'observed_days': np.asarray((as_of - first_day).days) + 1,
+        'pacing': elapsed_days / days_in_month * 100,
+    })
+
+def _weighted_pacing(monthly, by=None):
+    # 月別の理想進捗率を月別予算で加重平均する（予算が無ければ月の日数で加重）
+    if by:
+        has_budget = monthly.groupby(by)['monthly_budget'].transform('sum') > 0
+        weight = monthly['monthly_budget'].where(has_budget, monthly['days_in_month'])
+        return (weight * monthly['pacing']).groupby(monthly[by]).sum() / weight.groupby(monthly[by]).sum()
+    weight = monthly['monthly_budget'] if monthly['monthly_budget'].sum() > 0 else monthly['days_in_month']
+    return float((weight * monthly['pacing']).sum() / weight.sum())
+
+def monthly_kpis(campaign_daily, master_df, limits, start_date, end_date):
+    # キャンペーン × 月の実績・月別予算・進捗率・乖離・月末着地予測（全キャンペーン一括）
+    calendar_df = month_calendar(start_date, end_date)
+    actual = campaign_daily.assign(month=campaign_daily['target_date'].dt.strftime('%Y%m'))
+    actual = actual.groupby(['campaign_id', 'month'])[NUMERIC_COLS].sum().reset_index()
+
+    campaign_ids = pd.Index(master_df['campaign_id'].unique()).union(pd.Index(actual['campaign_id'].unique()))
+    monthly = pd.DataFrame({'campaign_id': campaign_ids}).merge(calendar_df, how='cross')
+    monthly = monthly.merge(actual, on=['campaign_id', 'month'], how='left')
+    monthly[NUMERIC_COLS] = monthly[NUMERIC_COLS].fillna(0)
+    month_limits = limits.drop_duplicates(['campaign_id', 'month'], keep='last')
+    monthly = monthly.merge(
+        month_limits[['campaign_id', 'month', 'charge_limit']].rename(columns={'charge_limit': 'monthly_budget'}),
+        on=['campaign_id', 'month'], how='left',
+    )
+    monthly['monthly_budget'] = monthly['monthly_budget'].fillna(0)
+
+    monthly['progress_percent'] = safe_divide(monthly['gross'], monthly['monthly_budget'], 100)
+    monthly['diff_point'] = monthly['progress_percent'] - monthly['pacing']
+    monthly['projected_gross'] = safe_divide(monthly['gross'], monthly['observed_days']) * monthly['days_in_month']
+    monthly['projected_progress'] = safe_divide(monthly['projected_gross'], monthly['monthly_budget'], 100)
+    return monthly
+
+def month_rollup(monthly):
+    # 月別サマリ（全キャンペーン合計）
+    rollup_df = monthly.groupby('month').agg(
+        monthly_budget=('monthly_budget', 'sum'),
+        gross=('gross', 'sum'),
+        impression=('impression', 'sum'),
+        click=('click', 'sum'),
+        projected_gross=('projected_gross', 'sum'),
+        pacing=('pacing', 'first'),
+    ).reset_index()
+    rollup_df['progress_percent'] = safe_divide(rollup_df['gross'], rollup_df['monthly_budget'], 100)
+    rollup_df['diff_point'] = rollup_df['progress_percent'] - rollup_df['pacing']
+    rollup_df['projected_progress'] = safe_divide(rollup_df['projected_gross'], rollup_df['monthly_budget'], 100)
+    rollup_df['period_ctr'] = safe_divide(rollup_df['click'], rollup_df['impression'], 100)
+    return rollup_df
+
+def daily_diff(campaign_daily):
+    # 最新日の実績と前日比（最新日に実績のあるキャンペーンのみ）。
+    # campaign_daily はキャンペーン × 日付で 1 行にまとめ済みの日別実績（RollupCube.campaign_daily）
+    if campaign_daily.empty:
+        return pd.DataFrame(columns=DAILY_DIFF_COLUMNS)
+
+    latest_date = campaign_daily['target_date'].max()
+    prev_date = latest_date - datetime.timedelta(days=1)
+    latest = campaign_daily.loc[campaign_daily['target_date'] == latest_date].set_index('campaign_id')[DAILY_COLS]
+    prev = campaign_daily.loc[campaign_daily['target_date'] == prev_date].set_index('campaign_id')[DAILY_COLS]
+    prev = prev.reindex(latest.index, fill_value=0)
+
+    latest_ctr = safe_divide(latest['click'], latest['impression'], 100)
+    prev_ctr = safe_divide(prev['click'], prev['impression'], 100)
+
+    diff_df = pd.DataFrame({
+        'latest_gross': latest['gross'],
+        'diff_gross': latest['gross'] - prev['gross'],
+        'latest_imp': latest['impression'],
+        'diff_imp': latest['impression'] - prev['impression'],
+        'latest_click': latest['click'],
+        'diff_click': latest['click'] - prev['click'],
+        'latest_ctr': latest_ctr,
+        'diff_ctr': latest_ctr - prev_ctr,
+    })
+    return diff_df.reset_index()[DAILY_DIFF_COLUMNS]
+
+def campaign_kpis(campaign_daily, master_df, monthly):
+    # キャンペーン別の期間合計・前日比・進捗率・乖離・CTR・CPM。
+    # 理想進捗率は期間内の各月の理想進捗率を月別予算で加重したもの（1か月なら当月の理想進捗率）
+    agg_df = campaign_daily.groupby('campaign_id')[NUMERIC_COLS].sum().reset_index()
+    merged_df = agg_df.merge(master_df, on='campaign_id', how='left')
+    merged_df = merged_df.merge(daily_diff(campaign_daily), on='campaign_id', how='left')
+
+    merged_df['ideal_progress'] = merged_df['campaign_id'].map(_weighted_pacing(monthly, by='campaign_id'))
+    merged_df['progress_percent'] = safe_divide(merged_df['gross'], merged_df['monthly_budget'], 100)
+    merged_df['daily_progress_diff'] = safe_divide(merged_df['latest_gross'], merged_df['monthly_budget'], 100)
+    merged_df['diff_point'] = merged_df['progress_percent'] - merged_df['ideal_progress']
+    merged_df['period_ctr'] = safe_divide(merged_df['click'], merged_df['impression'], 100)
+    merged_df['period_cpm'] = safe_divide(merged_df['gross'], merged_df['impression'], 1000)
+    return merged_df
+
+def summary(merged_df, monthly, start_date, end_date):
+    # 全体サマリ（予算・消化・予測・IMP/Click・平均指標）
+    pacing = _weighted_pacing(monthly)
+    period_days = max((end_date - start_date).days + 1, 1)
+
+    total_budget = merged_df['monthly_budget'].sum()
+    total_gross = merged_df['gross'].sum()
+    total_imp = merged_df['impression'].sum()
+    total_click = merged_df['click'].sum()
+
+    return {
+        'standard_pacing': pacing,
+        'period_days': period_days,
+        'total_budget': total_budget,
+        'total_gross': total_gross,
+        'latest_gross': merged_df['latest_gross'].sum(),
+        'diff_gross': merged_df['diff_gross'].sum(),
+        'avg_progress': merged_df.loc[merged_df['monthly_budget'] > 0, 'progress_percent'].mean(),
+        'total_imp': total_imp,
+        'total_click': total_click,
+        'latest_imp': merged_df['latest_imp'].sum(),
+        'diff_imp': merged_df['diff_imp'].sum(),
+        'latest_click': merged_df['latest_click'].sum(),
+        'diff_click': merged_df['diff_click'].sum(),
+        'daily_avg_imp': total_imp / period_days,
+        'daily_avg_click': total_click / period_days,
+        'ctr': safe_divide(total_click, total_imp, 100),
+        'cpm': safe_divide(total_gross, total_imp, 1000),
+    }
+
+def series_kpis(daily, budget, by=None):
+    # 日別系列（target_date, gross, impression, click）に累積値・CTR・CPM・残予算・進捗率を付与する。
+    # by を指定すると by 列ごとに累積し、budget は by の値をインデックスにした Series で渡す。
+    # 累積値（cum_gross / cum_imp / cum_click）が付与済みなら（RollupCube.series）そのまま使う。
+    sort_cols = [by, 'target_date'] if by else ['target_date']
+    df = daily.sort_values(sort_cols).reset_index(drop=True)
+    if 'cum_gross' not in df.columns:
+        cum = (df.groupby(by)[DAILY_COLS] if by else df[DAILY_COLS]).cumsum()
+        df['cum_gross'] = cum['gross']
+        df['cum_imp'] = cum['impression']
+        df['cum_click'] = cum['click']
+
+    df['daily_ctr'] = safe_divide(df['click'], df['impression'], 100)
+    df['cum_ctr'] = safe_divide(df['cum_click'], df['cum_imp'], 100)
+    df['daily_cpm'] = safe_divide(df['gross'], df['impression'], 1000)
+
+    budgets = df[by].map(budget).fillna(0).to_numpy(dtype=float) if by else np.full(len(df), float(budget))
+    df['remaining_budget'] = np.where(budgets > 0, budgets - df['cum_gross'], 0)
+    df['actual_progress'] = safe_divide(df['cum_gross'], budgets, 100)
+    return df
+
+def ideal_line(monthly_budgets, cpc=TARGET_CPC):
+    # 期間にかかる各月（monthly_budgets: "YYYYMM" → 月別予算）の日割り理想線（進捗率・消化額・Click）。
+    # 予算が無い場合の理想進捗率は日数按分
+    months = pd.to_datetime(pd.Index(monthly_budgets.index), format='%Y%m').sort_values()
+    dates = pd.date_range(months[0], months[-1] + pd.offsets.MonthEnd(0), freq='D')
+    budgets = dates.strftime('%Y%m').map(monthly_budgets).to_numpy(dtype=float)
+    daily_budget = np.nan_to_num(budgets) / np.asarray(dates.days_in_month)
+    cum_budget = np.cumsum(daily_budget)
+    total_budget = daily_budget.sum()
+    ideal_progress = cum_budget / total_budget * 100 if total_budget > 0 else np.arange(1, len(dates) + 1) / len(dates) * 100
+    return pd.DataFrame({
+        'date': dates,
+        'ideal_progress': ideal_progress,
+        'ideal_daily_gross': daily_budget,
+        'ideal_cum_click': cum_budget / cpc,
+        'ideal_daily_click': daily_budget / cpc,
+    })
+
+def forecast(state, start_date, period_end, cpc=TARGET_CPC):
+    # 最新日の累積値から period_end までの予測（現状ペース維持）と必要ペースを日別に展開する。
+    # state は 1 行 1 対象で latest_date / cum_gross / cum_click / budget を持つ DataFrame。
+    # それ以外の列（キーなど）は結果の各行にそのまま引き継ぐ。
+    value_cols = ['latest_date', 'cum_gross', 'cum_click', 'budget']
+    latest = pd.to_datetime(state['latest_date'])
+    days_remaining = (pd.Timestamp(period_end) - latest).dt.days.clip(lower=0).to_numpy()
+    days_elapsed = ((latest - pd.Timestamp(start_date)).dt.days + 1).clip(lower=1).to_numpy()
+
+    rows = np.repeat(np.arange(len(state)), days_remaining)
+    offsets = np.repeat(np.cumsum(days_remaining) - days_remaining, days_remaining)
+    steps = np.arange(len(rows)) - offsets + 1
+
+    cum_gross = state['cum_gross'].to_numpy(dtype=float)
+    cum_click = state['cum_click'].to_numpy(dtype=float)
+    budget = state['budget'].to_numpy(dtype=float)
+    avg_daily_gross = cum_gross / days_elapsed
+    avg_daily_click = cum_click / days_elapsed
+    req_daily_gross = safe_divide(np.maximum(budget - cum_gross, 0), days_remaining)
+    req_daily_click = req_daily_gross / cpc
+
+    result = state.drop(columns=value_cols).iloc[rows].reset_index(drop=True)
+    result['date'] = latest.to_numpy()[rows] + pd.to_timedelta(steps, unit='D')
+    result['forecast_cum_gross'] = cum_gross[rows] + avg_daily_gross[rows] * steps
+    result['forecast_cum_click'] = cum_click[rows] + avg_daily_click[rows] * steps
+    result['forecast_progress'] = safe_divide(result['forecast_cum_gross'], budget[rows], 100)
+    result['req_daily_click'] = req_daily_click[rows]
+    result['recovery_progress'] = safe_divide(cum_gross[rows] + req_daily_gross[rows] * steps, budget[rows], 100)
+    result['recovery_cum_click'] = cum_click[rows] + req_daily_click[rows] * steps
+    return result
+
+def exhaustion_forecast(campaign_daily, budgets, start_date, end_date, groups=None, window_days=BURN_WINDOW_DAYS):
+    # 対象ごとの予算枯渇予測（全対象を一括で計算する）。
+    # campaign_daily: キャンペーン × 日付の日別実績 / budgets: キャンペーンID → end_date の月の月別予算。
+    # groups（キャンペーンID → 集計先のキー）を渡すと、キャンペーンの値をキーごとに合算して予測する（アカウント別・全体）。
+    # 予算は月ごとに区切られるので、複数月の期間でも end_date の月の予算と、その月の消化額（月初から）で予測する。
+    # 消化ペースは end_date までの直近 window_days 日（期間がそれより短ければ期間全体）の平均日別消化額で、
+    # 予測の終点は end_date の月の月末
+    end = pd.Timestamp(end_date)
+    window = max(min(window_days, (end_date - start_date).days + 1), 1)
+    days_remaining = ((end + pd.offsets.MonthEnd(0)) - end).days
+    window_start = end - pd.Timedelta(days=window - 1)
+    month_start = max(end.replace(day=1), pd.Timestamp(start_date))
+
+    month_daily = campaign_daily.loc[campaign_daily['target_date'] >= month_start]
+    spent = month_daily.groupby('campaign_id')['gross'].sum()
+    recent = campaign_daily.loc[campaign_daily['target_date'] >= window_start].groupby('campaign_id')['gross'].sum()
+    base = pd.DataFrame({'budget': budgets, 'spent': spent, 'window_gross': recent}).fillna(0)
+    if groups is not None:
+        base = base.groupby(base.index.map(groups)).sum().rename_axis(None)
+
+    budget = base['budget'].to_numpy(dtype=float)
+    spent = base['spent'].to_numpy(dtype=float)
+    burn_rate = base['window_gross'].to_numpy(dtype=float) / window
+    remaining = np.maximum(budget - spent, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_to_exhaustion = np.where(burn_rate > 0, remaining / burn_rate, np.nan)
+    required_daily = safe_divide(remaining, np.full(len(base), days_remaining))
+    projected_spend = spent + burn_rate * days_remaining
+
+    result = pd.DataFrame({
+        'budget': budget,
+        'spent': spent,
+        'remaining_budget': remaining,
+        'burn_rate': burn_rate,
+        'days_to_exhaustion': days_to_exhaustion,
+        'exhaustion_date': end + pd.to_timedelta(np.ceil(days_to_exhaustion), unit='D'),
+        'projected_spend': projected_spend,
+        'projected_progress': safe_divide(projected_spend, budget, 100),
+        'required_daily': required_daily,
+        'pace_ratio': safe_divide(burn_rate, required_daily),
+    }, index=base.index)
+    result['days_remaining'] = days_remaining
+    return result
+
+def rank_alerts(forecast, under_threshold=UNDER_DELIVERY_THRESHOLD):
+    # 予算のある対象のうち、月末より前に予算が尽きる（前倒し枯渇）か、着地予測が under_threshold % に
+    # 届かない（未達見込み）ものを、深刻度（前倒しになる日数の割合 / 着地の不足率）の大きい順に返す
+    df = forecast.loc[forecast['budget'] > 0]
+    days_remaining = df['days_remaining'].to_numpy(dtype=float)
+    days_to_exhaustion = df['days_to_exhaustion'].to_numpy(dtype=float)
+    projected_progress = df['projected_progress'].to_numpy(dtype=float)
+
+    over = np.nan_to_num(days_to_exhaustion, nan=np.inf) < days_remaining
+    under = ~over & (projected_progress < under_threshold)
+    over_score = safe_divide(days_remaining - np.nan_to_num(days_to_exhaustion), days_remaining)
+    under_score = np.clip((100 - projected_progress) / 100, 0, 1)
+
+    df = df.assign(
+        risk=np.select([over, under], [RISK_OVER, RISK_UNDER], default=''),
+        risk_score=np.select([over, under], [over_score, under_score], default=0.0),
+    )
+    return df.loc[over | under].sort_values('risk_score', ascending=False, kind='stable')
@@ -0,0 +1,78 @@
+import collections
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# セッションのメモリ管理
+# セッションごとに持つ派生データ（グラフの系列・組み立て済みのグラフ・予測など）を、合計サイズの上限付きの
+# LRU キャッシュに置く。上限を超えたら最も長く使われていないものから捨て、必要になったら作り直す。
+# 取得・集計した結果（ダッシュボード本体）は共有キャッシュと同じものを参照するので、この上限には含めない。
+
+# 1 セッションの派生データの上限（MB）
+SESSION_CACHE_MB = float(os.environ.get("MICROAD_SESSION_CACHE_MB", 64))
+
+def nbytes(obj):
+    # DataFrame / 配列 / グラフ / それらを含む dict・list のおおよそのメモリ使用量（バイト）
+    if obj is None:
+        return 0
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sum(nbytes(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(nbytes(value) for value in obj)
+    if callable(getattr(obj, 'nbytes', None)):
+        # RollupCube など、自分で使用量を返せるもの
+        return obj.nbytes()
+    if hasattr(obj, 'data') and hasattr(obj, 'layout'):
+        # plotly の Figure: 各トレースの座標の配列を数える
+        return sum(nbytes(np.asarray(trace[axis])) for trace in obj.data for axis in ('x', 'y') if trace[axis] is not None)
+    return sys.getsizeof(obj)
+
+class LRUCache:
+    # 合計サイズ（nbytes の見積もり）が max_bytes を超えたら、最も長く使われていないものから捨てる。
+    # 直前に入れたものは上限を超えていても残す（1 つも持てないと毎回作り直しになるため）
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.evictions = 0
+        self._items = collections.OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key][0]
+
+    def put(self, key, value):
+        self.pop(key)
+        size = nbytes(value)
+        self._items[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes and len(self._items) > 1:
+            _, (_, evicted_size) = self._items.popitem(last=False)
+            self.nbytes -= evicted_size
+            self.evictions += 1
+        return value
+
+    def pop(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.nbytes -= item[1]
+        return item[0] if item is not None else None
+
+    def clear(self):
+        self._items.clear()
+        self.nbytes = 0
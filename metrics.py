@@ -0,0 +1,149 @@
+import contextlib
+import datetime
+import json
+import logging
+import os
+import resource
+import threading
+import time
+import tracemalloc
+import uuid
+
+import pandas as pd
+
+# 処理段階ごとの計測
+# 取得・マスタ作成・集計・テーブル書式・グラフ作成などの段階ごとに、処理時間・処理行数・
+# レスポンスのバイト数・メモリ（プロセスの最大常駐メモリと、有効時は tracemalloc のピーク）を記録する。
+# 記録は JSON 形式のログ行（MICROAD_METRICS_LOG=1）と Prometheus のテキストファイル
+# （MICROAD_METRICS_PROM_PATH。node_exporter の textfile collector 向け）に出力できる。
+
+LOG_ENABLED = os.environ.get("MICROAD_METRICS_LOG", "").lower() in ("1", "true", "yes")
+PROM_PATH = os.environ.get("MICROAD_METRICS_PROM_PATH")
+
+PROM_PREFIX = "microad_dashboard"
+# Prometheus に出す項目（記録のキー → メトリクス名, 説明）
+PROM_FIELDS = {
+    'seconds': ("stage_seconds", "Wall time of the latest run of the stage in seconds."),
+    'rows': ("stage_rows", "Rows processed by the latest run of the stage."),
+    'response_bytes': ("stage_response_bytes", "Response body bytes read by the latest run of the stage."),
+    'requests': ("stage_requests", "API requests sent by the latest run of the stage."),
+    'max_rss_mb': ("stage_max_rss_megabytes", "Process max resident memory after the latest run of the stage."),
+    'peak_mb': ("stage_traced_peak_megabytes", "tracemalloc peak during the latest run of the stage."),
+}
+
+logger = logging.getLogger("microad_dashboard.metrics")
+if LOG_ENABLED and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# プロセス内の全セッションで共有する、段階ごとの最新値と実行回数（Prometheus 出力用）
+_latest = {}
+_runs = {}
+_latest_lock = threading.Lock()
+
+def max_rss_mb():
+    # プロセス開始以降の最大常駐メモリ（Linux の ru_maxrss は KB 単位）
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class RunMetrics:
+    # 1 回の実行（スクリプトの再実行 1 回、ベンチマーク 1 回など）の段階ごとの記録。
+    # trace_memory を有効にすると tracemalloc でピークメモリも測る（処理は遅くなる。
+    # tracemalloc はプロセス全体で 1 つなので、同時に動く他のセッションの確保も含まれる）。
+    # prefix は段階名の前に付ける（バックグラウンド処理の計測を画面の操作と分けるため）
+    def __init__(self, trace_memory=False, prefix=""):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.trace_memory = trace_memory
+        self.prefix = prefix
+        self.stages = {}
+        # 段階に属さない実行単位の値（セッションのメモリ使用量など）。JSON ログにだけ出す
+        self.values = {}
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        # with 内で返り値の辞書に rows などを設定できる
+        entry = dict(fields)
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry['seconds'] = time.perf_counter() - started
+            entry['max_rss_mb'] = max_rss_mb()
+            if self.trace_memory:
+                entry['peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            if tracing:
+                tracemalloc.stop()
+            self.stages[self.prefix + name] = entry
+
+    def records(self):
+        return [{'stage': name, **entry} for name, entry in self.stages.items()]
+
+    def emit(self):
+        # 記録を JSON ログ行と Prometheus のテキストファイルに出力する（どちらも設定時のみ）
+        if not self.stages and not self.values:
+            return
+        timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds')
+        if LOG_ENABLED:
+            if self.values:
+                logger.info(json.dumps({'ts': timestamp, 'run_id': self.run_id, **self.values}, ensure_ascii=False, default=str))
+            for record in self.records():
+                logger.info(json.dumps({'ts': timestamp, 'run_id': self.run_id, **record}, ensure_ascii=False, default=str))
+        with _latest_lock:
+            for name, entry in self.stages.items():
+                _latest[name] = dict(entry)
+                _runs[name] = _runs.get(name, 0) + 1
+        if PROM_PATH:
+            write_prometheus(PROM_PATH)
+
+# デバッグ表示の列（記録のキー → 表示名）
+DISPLAY_COLUMNS = {
+    'stage': '段階', 'seconds': '秒', 'rows': '行数', 'requests': 'リクエスト',
+    'response_bytes': '受信バイト', 'max_rss_mb': '最大RSS(MB)', 'peak_mb': 'ピーク(MB)',
+}
+
+def records_frame(records):
+    # 記録のリストを表示用の DataFrame にする（記録の無い項目の列は出さない）
+    df = pd.DataFrame(records)
+    df = df[[col for col in DISPLAY_COLUMNS if col in df.columns]]
+    return df.rename(columns=DISPLAY_COLUMNS)
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_text():
+    # 段階ごとの最新値（gauge）と実行回数（counter）を Prometheus のテキスト形式で返す
+    with _latest_lock:
+        latest = {name: dict(entry) for name, entry in _latest.items()}
+        runs = dict(_runs)
+    lines = []
+    for field, (metric, help_text) in PROM_FIELDS.items():
+        samples = [(name, entry[field]) for name, entry in latest.items() if entry.get(field) is not None]
+        if not samples:
+            continue
+        lines.append(f"# HELP {PROM_PREFIX}_{metric} {help_text}")
+        lines.append(f"# TYPE {PROM_PREFIX}_{metric} gauge")
+        for name, value in samples:
+            lines.append(f'{PROM_PREFIX}_{metric}{{stage="{_escape_label(name)}"}} {float(value):.6g}')
+    if runs:
+        lines.append(f"# HELP {PROM_PREFIX}_stage_runs_total Number of recorded runs of the stage.")
+        lines.append(f"# TYPE {PROM_PREFIX}_stage_runs_total counter")
+        for name, count in runs.items():
+            lines.append(f'{PROM_PREFIX}_stage_runs_total{{stage="{_escape_label(name)}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path):
+    # 読み取り途中のファイルを見せないように、一時ファイルに書いてから置き換える
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
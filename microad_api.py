@@ -0,0 +1,141 @@
+import concurrent.futures
+import datetime
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import report_parser
+
+# MicroAd レポート API クライアント
+# 長い期間を日/週単位のウィンドウに分割し、keep-alive セッション上で並列に取得して結合する。
+# レスポンス本文はストリームのまま report_parser でカラム形式（ReportFrames）に変換する。
+
+REPORT_API_URL = os.environ.get("MICROAD_API_URL", "https://report.ads-api.universe.microad.jp/v2/reports")
+
+# リトライ対象のステータス（レート制限・サーバー側エラー）
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# 本文の読み込み単位
+STREAM_CHUNK_SIZE = 64 * 1024
+
+class MicroAdAPIError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+def split_range(start, end, window_days=7):
+    # [start, end] を window_days 日ごとの区間に分割する
+    windows = []
+    window_start = start
+    while window_start <= end:
+        window_end = min(window_start + datetime.timedelta(days=window_days - 1), end)
+        windows.append((window_start, window_end))
+        window_start = window_end + datetime.timedelta(days=1)
+    return windows
+
+class MicroAdClient:
+    def __init__(self, api_key, base_url=REPORT_API_URL, timeout=(5, 60), max_workers=4, window_days=7,
+                 max_retries=4, backoff=1.0, max_backoff=30.0):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.window_days = window_days
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        # 並列数ぶんのコネクションを使い回す
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"x-api-key": api_key, "Content-Type": "application/json"})
+
+        # 429 を受けたら全ワーカーがこの時刻まで待つ
+        self._rate_lock = threading.Lock()
+        self._not_before = 0.0
+
+        # 計測用: 送ったリクエスト数（リトライを含む）と読み込んだ本文のバイト数
+        self._stats_lock = threading.Lock()
+        self.requests_sent = 0
+        self.bytes_received = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def _wait_for_rate_limit(self):
+        with self._rate_lock:
+            wait = self._not_before - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def _delay(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        # 指数バックオフ + ジッタ
+        return min(self.backoff * (2 ** attempt), self.max_backoff) * random.uniform(0.5, 1.0)
+
+    def _count_bytes(self, chunks):
+        for chunk in chunks:
+            with self._stats_lock:
+                self.bytes_received += len(chunk)
+            yield chunk
+
+    def fetch_window(self, start, end, report_type="campaign"):
+        payload = {
+            "start_date": start.strftime("%Y%m%d"),
+            "end_date": end.strftime("%Y%m%d"),
+            "report_type": report_type
+        }
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_rate_limit()
+            response = None
+            with self._stats_lock:
+                self.requests_sent += 1
+            try:
+                with self.session.request("GET", self.base_url, json=payload, timeout=self.timeout, stream=True) as response:
+                    if response.status_code < 400:
+                        return report_parser.parse_stream(self._count_bytes(response.iter_content(chunk_size=STREAM_CHUNK_SIZE)))
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                if attempt == self.max_retries:
+                    raise MicroAdAPIError(f"{payload['start_date']}-{payload['end_date']}: {e}") from e
+                response = None
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    raise MicroAdAPIError(
+                        f"{payload['start_date']}-{payload['end_date']}: HTTP {response.status_code} {response.reason}",
+                        status_code=response.status_code,
+                    )
+
+            delay = self._delay(attempt, response)
+            if response is not None and response.status_code == 429:
+                with self._rate_lock:
+                    self._not_before = max(self._not_before, time.monotonic() + delay)
+            else:
+                time.sleep(delay)
+
+    def iter_windows(self, start, end, report_type="campaign"):
+        # ウィンドウを並列に取得し、期間の古い順に (開始日, 終了日, ReportFrames) を返す
+        windows = split_range(start, end, self.window_days)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(lambda window: self.fetch_window(window[0], window[1], report_type), windows)
+            for (window_start, window_end), frames in zip(windows, results):
+                yield window_start, window_end, frames
+
+    def fetch_range(self, start, end, report_type="campaign"):
+        # マスタは ID 単位で後のウィンドウを優先し、実績は (日付, キャンペーンID) 順に並べて結果を決定的にする
+        return report_parser.concat_frames(frames for _, _, frames in self.iter_windows(start, end, report_type))
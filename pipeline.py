@@ -0,0 +1,174 @@
+import concurrent.futures
+import datetime
+import hashlib
+import os
+import re
+from contextlib import closing
+
+import pandas as pd
+
+import kpi
+import metrics
+import microad_api
+import report_parser
+import report_store
+import rollup
+import table_view
+
+# 取得・集計パイプライン
+# API からの取得（ローカルストアとの差分のみ）と、ダッシュボードに表示する集計一式の作成。
+# Streamlit に依存しないので、画面の「データ取得」からもバックグラウンドの事前取得からも使う。
+
+# 複数の API Key をまとめて表示する場合のキーファイル（1 行に「キー [表示名]」、"#" で始まる行は無視）
+API_KEYS_FILE = os.environ.get("MICROAD_API_KEYS_FILE")
+# 複数の API Key を同時に取得する数（各キーの期間もさらに週単位で並列取得される）
+SOURCE_FETCH_WORKERS = 4
+
+def hash_api_key(api_key):
+    # キャッシュキーにはAPI Keyそのものではなくハッシュ値を使う
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+def sources_hash(api_keys):
+    # 複数の API Key の組み合わせのキャッシュキー（1 つだけなら hash_api_key と同じ）
+    keys = sorted(set(api_keys))
+    return hash_api_key(keys[0]) if len(keys) == 1 else hash_api_key("\n".join(keys))
+
+def key_label(api_key):
+    # 取得元の表示名の既定（キーの末尾 4 文字）
+    return f"Key …{api_key[-4:]}"
+
+def parse_keys(text):
+    # カンマ・空白・改行区切りの API Key（重複は除く）
+    return list(dict.fromkeys(key for key in re.split(r'[,\s]+', text or '') if key))
+
+def read_keys_file(path=API_KEYS_FILE):
+    # キーファイルの API Key → 表示名（表示名の省略時は key_label）
+    sources = {}
+    if not path or not os.path.exists(path):
+        return sources
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            key, _, label = line.partition(" ")
+            sources[key] = label.strip() or key_label(key)
+    return sources
+
+def default_range(today=None):
+    # 画面の既定の期間（当月 1 日〜昨日）
+    today = today or datetime.date.today()
+    return today.replace(day=1), today - datetime.timedelta(days=1)
+
+def fetch_report(api_key, start, end, report_type="campaign", stage=None):
+    # 長い期間は週単位に分割して並列取得される。stage には実際に送ったリクエスト数と受信バイト数を足す
+    with microad_api.MicroAdClient(api_key) as client:
+        frames = client.fetch_range(start, end, report_type)
+    if stage is not None:
+        stage['requests'] = stage.get('requests', 0) + client.requests_sent
+        stage['response_bytes'] = stage.get('response_bytes', 0) + client.bytes_received
+    return frames
+
+def sync_report(key_hash, start, end, fetch, refetch_days=0):
+    # ローカルストアに無い日付（と直近 refetch_days 日）だけを fetch(開始日, 終了日) で取得して保存し、
+    # 期間全体をストアから返す
+    with closing(report_store.connect()) as conn:
+        for gap_start, gap_end in report_store.missing_ranges(conn, key_hash, start, end, refetch_days):
+            report_store.save_frames(conn, key_hash, fetch(gap_start, gap_end), gap_start, gap_end)
+        return report_store.load_frames(conn, key_hash, start, end)
+
+def tag_source(frames, label):
+    # キャンペーンマスタに取得元（API Key の表示名）を付ける。実績はキャンペーンID で取得元に結び付く
+    return frames._replace(campaigns=frames.campaigns.assign(source=label))
+
+def merge_sources(frames_list):
+    # 取得元ごとの結果を 1 つにまとめる。複数のキーで同じキャンペーンが取れた場合は後の取得元の 1 件だけを残す
+    frames = report_parser.concat_frames(frames_list)
+    records = frames.records.drop_duplicates(['campaign_id', 'target_date'], keep='last').reset_index(drop=True)
+    campaigns = report_parser.compact_names(frames.campaigns, ['source'])
+    return frames._replace(campaigns=campaigns, records=records)
+
+def fetch_sources(sources, fetch, max_workers=SOURCE_FETCH_WORKERS):
+    # sources（API Key → 表示名）を並列に fetch(API Key) で取得し、取得元を付けてまとめる。
+    # 1 つのキーの失敗で他の取得を止めないように、失敗は {表示名: 例外} として返す
+    results, errors = {}, {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fetch, api_key): api_key for api_key in sources}
+        for future in concurrent.futures.as_completed(futures):
+            api_key = futures[future]
+            try:
+                results[api_key] = tag_source(future.result(), sources[api_key])
+            except Exception as e:
+                errors[sources[api_key]] = e
+    if not results:
+        return None, errors
+    # 結合順（重複時の優先順）は指定順にそろえる
+    return merge_sources([results[api_key] for api_key in sources if api_key in results]), errors
+
+def budget_column_label(months):
+    # 1か月なら当月予算、複数月にまたがる期間なら各月予算の合計
+    return '当月予算' if len(months) == 1 else '期間予算'
+
+def build_dashboard(frames, start_date, end_date, run_metrics=None):
+    run_metrics = run_metrics or metrics.RunMetrics()
+    # 1. マスタ作成（期間にかかる各月の月別予算の合計を付与）
+    months = kpi.month_calendar(start_date, end_date)['month'].tolist()
+    with run_metrics.stage('master') as stage:
+        master_df = report_parser.build_master(frames.campaigns, frames.limits, months)
+        stage['rows'] = len(master_df)
+
+    # 2. 実績データ（取得時に数値・日付の型変換済み）
+    perf_df = frames.records
+    if perf_df.empty:
+        return None
+
+    with run_metrics.stage('aggregation', rows=len(perf_df)):
+        # キャンペーン/アカウント/全体の日別系列を 1 回の集計で作っておく
+        cube = rollup.RollupCube(perf_df, master_df, frames.limits, months)
+
+        # 月別の実績・予算・進捗（複数月の期間は月ごとに理想進捗率を持つ）
+        monthly_df = kpi.monthly_kpis(cube.campaign_daily, master_df, frames.limits, start_date, end_date)
+
+    with run_metrics.stage('campaign_kpis') as stage:
+        # 集計・前日比・進捗計算（全キャンペーン一括）
+        merged_df = kpi.campaign_kpis(cube.campaign_daily, master_df, monthly_df)
+        stage['rows'] = len(merged_df)
+
+        # 表示用DF
+        budget_label = budget_column_label(months)
+        table_display_df = table_view.display_table(merged_df, budget_label)
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        # 実績（perf_df）とキャンペーン別 KPI（merged_df）は cube と表示用テーブルに含まれるので保持しない
+        'master_df': master_df,
+        'limits_df': frames.limits,
+        'cube': cube,
+        'table_display_df': table_display_df,
+        'budget_label': budget_label,
+        'summary': kpi.summary(merged_df, monthly_df, start_date, end_date),
+        'month_rollup_df': kpi.month_rollup(monthly_df) if len(months) > 1 else None,
+    }
+
+def exhaustion_alerts(dashboard, window_days=kpi.BURN_WINDOW_DAYS):
+    # キャンペーン別・アカウント別・全体の予算枯渇予測と、要注意のキャンペーン・アカウントの一覧
+    # （複数月の期間でも、予測は終了日の月の予算と消化額で行う）
+    cube = dashboard['cube']
+    start_date, end_date = dashboard['start_date'], dashboard['end_date']
+    budgets = cube.month_budgets(rollup.LEVEL_CAMPAIGN, end_date.strftime('%Y%m'))
+    master = dashboard['master_df'].drop_duplicates('campaign_id').set_index('campaign_id')
+
+    campaigns = kpi.exhaustion_forecast(cube.campaign_daily, budgets, start_date, end_date, window_days=window_days)
+    campaigns = campaigns.join(master[['account_name', 'campaign_name']])
+    accounts = kpi.exhaustion_forecast(cube.campaign_daily, budgets, start_date, end_date, cube.account_of, window_days)
+    account_names = pd.Series(master['account_name'].to_numpy(), index=cube.account_of.reindex(master.index).to_numpy())
+    accounts['account_name'] = accounts.index.map(account_names[~account_names.index.duplicated()])
+    total = kpi.exhaustion_forecast(
+        cube.campaign_daily, budgets, start_date, end_date, pd.Series('total', index=budgets.index), window_days,
+    )
+    return {
+        'total': total.iloc[0] if len(total) else None,
+        'campaigns': kpi.rank_alerts(campaigns),
+        'accounts': kpi.rank_alerts(accounts),
+    }
@@ -0,0 +1,130 @@
+import collections
+import datetime
+import logging
+import os
+import threading
+import time
+
+import metrics
+import pipeline
+
+# バックグラウンドの事前取得
+# 設定した API Key の当月分（画面の既定の期間）を定期的に取得・集計し、共有キャッシュに置いておく。
+# 画面の「データ取得」はまず共有キャッシュを見るので、朝一番の取得も集計済みの結果を返すだけで済む。
+# 共有キャッシュはサーバープロセスに 1 つで、全セッションから参照される（画面側で取得した結果も置く）。
+#   MICROAD_PREFETCH_KEYS: 事前取得する API Key（カンマ区切り）
+#   MICROAD_PREFETCH_KEYS_FILE: 事前取得する API Key のファイル（MICROAD_API_KEYS_FILE と同じ「キー 表示名」の形式）
+#   MICROAD_PREFETCH_INTERVAL: 取得間隔（秒）
+
+PREFETCH_INTERVAL = int(os.environ.get("MICROAD_PREFETCH_INTERVAL", 60 * 60))
+# 事前取得でも直近この日数は取り直す（前日分は夜間に確定するため）
+PREFETCH_REFETCH_DAYS = 2
+# 集計済みの結果をこの秒数より古くなったら古いものとして扱う
+CACHE_MAX_AGE = 3 * 60 * 60
+# 共有キャッシュに保持する件数（上限を超えると最も使われていないものから破棄）
+CACHE_MAX_ENTRIES = 32
+
+logger = logging.getLogger("microad_dashboard.prefetch")
+
+def configured_keys():
+    keys = pipeline.parse_keys(os.environ.get("MICROAD_PREFETCH_KEYS", ""))
+    keys += list(pipeline.read_keys_file(os.environ.get("MICROAD_PREFETCH_KEYS_FILE")))
+    return list(dict.fromkeys(keys))
+
+def is_stale(entry, now=None, max_age=CACHE_MAX_AGE):
+    # 前日以前に作ったもの（夜間に確定した前日分を含まない）か、max_age 秒より古いものは古い
+    now = now or time.time()
+    built_day = datetime.date.fromtimestamp(entry['built_at'])
+    return built_day < datetime.date.fromtimestamp(now) or now - entry['built_at'] > max_age
+
+class SharedCache:
+    # (API Key のハッシュ, 開始日, 終了日) → 集計済みのダッシュボード
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key_hash, start, end):
+        with self._lock:
+            entry = self._entries.get((key_hash, start, end))
+            if entry is not None:
+                self._entries.move_to_end((key_hash, start, end))
+            return entry
+
+    def put(self, key_hash, start, end, dashboard, source):
+        entry = {'dashboard': dashboard, 'built_at': time.time(), 'source': source}
+        with self._lock:
+            self._entries[(key_hash, start, end)] = entry
+            self._entries.move_to_end((key_hash, start, end))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, key_hash=None):
+        # key_hash の結果（省略時はすべて）を破棄し、破棄した件数を返す
+        with self._lock:
+            targets = [key for key in self._entries if key_hash is None or key[0] == key_hash]
+            for key in targets:
+                del self._entries[key]
+        return len(targets)
+
+class Prefetcher:
+    def __init__(self, api_keys, cache, interval=PREFETCH_INTERVAL):
+        self.api_keys = list(api_keys)
+        self.cache = cache
+        self.interval = interval
+        # API Key のハッシュ → 直近の実行結果（時刻・所要時間・エラー）
+        self.status = {}
+        self.next_run_at = None
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self.api_keys:
+            self._thread = threading.Thread(target=self._run, name="microad-prefetch", daemon=True)
+            self._thread.start()
+        return self
+
+    def refresh_now(self):
+        # 次の定期実行を待たずに取得する
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self.refresh_all()
+            self.next_run_at = time.time() + self.interval
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def refresh_all(self, today=None):
+        for api_key in self.api_keys:
+            key_hash = pipeline.hash_api_key(api_key)
+            started = time.time()
+            try:
+                self.refresh(api_key, today)
+                self.status[key_hash] = {'finished_at': time.time(), 'seconds': time.time() - started, 'error': None}
+            except Exception as e:
+                # 1 つの API Key の失敗で他の取得を止めない
+                logger.warning("prefetch failed for %s: %s", key_hash[:8], e)
+                self.status[key_hash] = {'finished_at': time.time(), 'seconds': time.time() - started, 'error': str(e)}
+
+    def refresh(self, api_key, today=None):
+        start, end = pipeline.default_range(today)
+        if start > end:
+            # 月初日は当月の実績がまだ無い
+            return None
+        key_hash = pipeline.hash_api_key(api_key)
+        run_metrics = metrics.RunMetrics(prefix="prefetch_")
+        with run_metrics.stage('fetch', requests=0, response_bytes=0) as stage:
+            frames = pipeline.sync_report(
+                key_hash, start, end,
+                lambda gap_start, gap_end: pipeline.fetch_report(api_key, gap_start, gap_end, stage=stage),
+                PREFETCH_REFETCH_DAYS,
+            )
+            stage['rows'] = len(frames.records)
+        dashboard = pipeline.build_dashboard(frames, start, end, run_metrics)
+        run_metrics.emit()
+        if dashboard is None:
+            return None
+        dashboard['build_metrics'] = run_metrics.records()
+        return self.cache.put(key_hash, start, end, dashboard, source='prefetch')
@@ -0,0 +1,336 @@
+import array
+import codecs
+import collections
+import json
+
+import numpy as np
+import pandas as pd
+
+# レポートパーサ
+# レスポンスを辞書のリストに展開せず、account[].campaign[] と report.records を
+# 一定件数ごとに型変換して型付きのカラムバッファ（int64 / float64 配列）に積み、DataFrame を組み立てる。
+
+# campaigns: キャンペーンマスタ / limits: 月別予算 / records: 日別実績
+ReportFrames = collections.namedtuple('ReportFrames', ['campaigns', 'limits', 'records'])
+
+CAMPAIGN_COLUMNS = ['campaign_id', 'account_id', 'account_name', 'campaign_name']
+LIMIT_COLUMNS = ['campaign_id', 'month', 'charge_limit']
+RECORD_COLUMNS = ['campaign_id', 'target_date', 'net', 'gross', 'impression', 'click']
+
+_WHITESPACE = ' \t\n\r'
+
+# 実績はこの件数以上たまるごとにまとめて型変換し、カラムバッファに積む
+RECORD_BATCH_SIZE = 8192
+
+RECORD_DTYPES = {'net': 'float64', 'gross': 'float64', 'impression': 'int64', 'click': 'int64'}
+
+# 画面で保持するフレームの省メモリ化: 名前はカテゴリ型（値の種類ごとに 1 つだけ保持）にし、
+# カウンタは値が収まれば int32 にする（sum / cumsum は pandas が int64 で計算する）
+NAME_COLUMNS = ['account_name', 'campaign_name']
+COUNTER_COLUMNS = ['impression', 'click']
+_INT32 = np.iinfo(np.int32)
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _to_numeric(values, dtype):
+    # 数値または数値文字列だけなら numpy で直接変換し、欠損や不正値を含む場合だけ pandas で 0 埋めする
+    try:
+        return np.array(values, dtype=dtype)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values), errors='coerce').fillna(0).to_numpy(dtype)
+
+def _to_dates(values):
+    # 20240131 / "20240131" / "2024-01-31" をまとめて日付に変換する（解釈できなければ NaT）
+    text = pd.Series(values).astype(str).str.replace("-", "", regex=False).str.replace("/", "", regex=False)
+    return pd.to_datetime(text.str[:8], format="%Y%m%d", errors='coerce').to_numpy()
+
+class _JSONStream:
+    # バイト列チャンクのイテレータから JSON の値を順に読み出す簡易ストリームリーダ。
+    # 構造（オブジェクトのキー、配列の要素）は 1 つずつたどり、要素単位で json にデコードさせる。
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+
+    def _fill(self):
+        for chunk in self._chunks:
+            text = self._text_decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if text:
+                self.buf = self.buf[self.pos:] + text
+                self.pos = 0
+                return True
+        return False
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("JSONが途中で終了しています")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"JSONの形式が不正です: '{char}' が必要な位置に '{self.buf[self.pos]}' があります")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # 数値がチャンク境界で切れている可能性があるので、末尾で終わった場合は続きを読んで再デコードする
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+    def iter_object(self):
+        # キーを 1 つずつ返す。呼び出し側は次の要素に進む前に値を読み切ること
+        if self.peek() == 'n':
+            self.value()
+            return
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+    def iter_elements(self):
+        # 配列の要素ごとに制御を返す。呼び出し側は次の要素に進む前に要素の値を読み切ること
+        if self.peek() == 'n':
+            self.value()
+            return
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
+
+    def iter_array(self):
+        for _ in self.iter_elements():
+            yield self.value()
+
+    def iter_flat_array_batches(self):
+        # ネストを含まないオブジェクトの配列（report.records）を、バッファに揃った要素ごとに
+        # まとめてデコードして返す。文字列中の括弧などで切り出しに失敗した場合は 1 要素ずつ読む。
+        if self.peek() == 'n':
+            self.value()
+            return
+        self.expect('[')
+        while True:
+            if self.peek() == ']':
+                self.pos += 1
+                return
+            array_end = self.buf.find(']', self.pos)
+            cut = array_end if array_end >= 0 else self.buf.rfind('}', self.pos) + 1
+            if cut <= 0:
+                if not self._fill():
+                    raise ValueError("JSONが途中で終了しています")
+                continue
+            try:
+                batch = json.loads('[' + self.buf[self.pos:cut] + ']')
+            except json.JSONDecodeError:
+                break
+            self.pos = cut
+            yield batch
+            if array_end >= 0:
+                self.expect(']')
+                return
+            if self.peek() == ',':
+                self.pos += 1
+
+        while True:
+            yield [self.value()]
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
+
+class ReportBuilder:
+    def __init__(self):
+        self.campaigns = {col: [] for col in CAMPAIGN_COLUMNS}
+        self.limit_campaign_id = []
+        self.limit_month = []
+        self.limit_charge = array.array('d')
+        # 変換前の値（最大 RECORD_BATCH_SIZE 件）と、変換済みの配列のリスト
+        self._pending = {col: [] for col in RECORD_COLUMNS}
+        self._columns = {col: [] for col in RECORD_COLUMNS}
+
+    def add_account(self, acc):
+        acc_id = acc.get('id')
+        acc_name = acc.get('name', 'Unknown')
+        for camp in acc.get('campaign') or []:
+            self.add_campaign(acc_id, acc_name, camp)
+
+    def add_campaign(self, acc_id, acc_name, camp):
+        self.campaigns['campaign_id'].append(camp['id'])
+        self.campaigns['account_id'].append(acc_id)
+        self.campaigns['account_name'].append(acc_name)
+        self.campaigns['campaign_name'].append(camp.get('name'))
+        for limit in camp.get('campaign_monthly_charge_limit') or []:
+            if limit.get('month') is None:
+                continue
+            self.limit_campaign_id.append(camp['id'])
+            self.limit_month.append(str(limit['month']))
+            self.limit_charge.append(_to_float(limit.get('charge_limit', 0)))
+
+    def feed_account(self, stream):
+        # アカウントを 1 件読む。campaign 配列は要素ごとにデコードする（アカウント全体を 1 つの値として
+        # デコードすると、チャンクを読み足すたびに先頭から再デコードになり大きなアカウントで遅くなる）。
+        # キャンペーンの取り込みには id / name が必要なので、それらより前に来たキャンペーンは後で取り込む
+        fields = {}
+        pending = []
+        for key in stream.iter_object():
+            if key == 'campaign':
+                for _ in stream.iter_elements():
+                    camp = stream.value()
+                    pending.append(camp)
+                    if 'id' in fields and 'name' in fields:
+                        for camp in pending:
+                            self.add_campaign(fields['id'], fields['name'], camp)
+                        pending = []
+            else:
+                fields[key] = stream.value()
+        for camp in pending:
+            self.add_campaign(fields.get('id'), fields.get('name', 'Unknown'), camp)
+
+    def add_records(self, records):
+        pending = self._pending
+        pending['campaign_id'].extend([rec['campaign_id'] for rec in records])
+        for col in RECORD_COLUMNS[1:]:
+            pending[col].extend([rec.get(col) for rec in records])
+        if len(pending['campaign_id']) >= RECORD_BATCH_SIZE:
+            self._flush_records()
+
+    def _flush_records(self):
+        pending = self._pending
+        if not pending['campaign_id']:
+            return
+        self._columns['campaign_id'].append(pd.Series(pending['campaign_id']).to_numpy())
+        self._columns['target_date'].append(_to_dates(pending['target_date']))
+        for col, dtype in RECORD_DTYPES.items():
+            self._columns[col].append(_to_numeric(pending[col], dtype))
+        self._pending = {col: [] for col in RECORD_COLUMNS}
+
+    def add_payload(self, data):
+        # デコード済みのレスポンス（辞書）を取り込む
+        for acc in data.get('account') or []:
+            self.add_account(acc)
+        self.add_records((data.get('report') or {}).get('records') or [])
+
+    def feed(self, chunks):
+        # レスポンス本文をチャンク単位で読みながら取り込む（本文全体を辞書に展開しない）
+        stream = _JSONStream(chunks)
+        for key in stream.iter_object():
+            if key == 'account':
+                for _ in stream.iter_elements():
+                    self.feed_account(stream)
+            elif key == 'report':
+                for report_key in stream.iter_object():
+                    if report_key == 'records':
+                        for batch in stream.iter_flat_array_batches():
+                            self.add_records(batch)
+                    else:
+                        stream.value()
+            else:
+                stream.value()
+
+    def to_frames(self):
+        campaigns = pd.DataFrame(self.campaigns, columns=CAMPAIGN_COLUMNS)
+        limits = pd.DataFrame({
+            'campaign_id': pd.Series(self.limit_campaign_id),
+            'month': pd.Series(self.limit_month, dtype=str),
+            'charge_limit': np.frombuffer(self.limit_charge, dtype=np.float64),
+        }, columns=LIMIT_COLUMNS)
+        self._flush_records()
+        if self._columns['campaign_id']:
+            records = pd.DataFrame(
+                {col: np.concatenate(chunks) for col, chunks in self._columns.items()}, columns=RECORD_COLUMNS
+            )
+        else:
+            records = pd.DataFrame({
+                'campaign_id': pd.Series(dtype='int64'),
+                'target_date': pd.Series(dtype='datetime64[ns]'),
+                **{col: pd.Series(dtype=dtype) for col, dtype in RECORD_DTYPES.items()},
+            }, columns=RECORD_COLUMNS)
+        return ReportFrames(campaigns, limits, records)
+
+def parse_payload(data):
+    builder = ReportBuilder()
+    builder.add_payload(data)
+    return builder.to_frames()
+
+def parse_stream(chunks):
+    builder = ReportBuilder()
+    builder.feed(chunks)
+    return builder.to_frames()
+
+def concat_frames(frames_list):
+    # ウィンドウ単位の結果を結合する。マスタは後のウィンドウを優先し、実績は (日付, キャンペーンID) 順に並べる
+    frames_list = list(frames_list)
+    if not frames_list:
+        return ReportBuilder().to_frames()
+    # 空のフレームは ID 列の型推定を崩すので結合から外す
+    def _concat(frames):
+        non_empty = [df for df in frames if not df.empty]
+        return pd.concat(non_empty or frames[:1], ignore_index=True)
+
+    campaigns = _concat([f.campaigns for f in frames_list])
+    campaigns = campaigns.drop_duplicates('campaign_id', keep='last').reset_index(drop=True)
+    limits = _concat([f.limits for f in frames_list])
+    limits = limits.drop_duplicates(['campaign_id', 'month'], keep='last').reset_index(drop=True)
+    records = _concat([f.records for f in frames_list])
+    records = records.sort_values(['target_date', 'campaign_id'], kind='stable').reset_index(drop=True)
+    return ReportFrames(campaigns, limits, records)
+
+def build_master(campaigns, limits, months):
+    # months（"YYYYMM" のリスト）の月別予算の合計を monthly_budget として付与したキャンペーンマスタ
+    month_limits = limits.loc[limits['month'].isin(months)].drop_duplicates(['campaign_id', 'month'], keep='last')
+    budgets = month_limits.groupby('campaign_id')['charge_limit'].sum().rename('monthly_budget').reset_index()
+    if budgets.empty:
+        # 予算もアカウントも無いレスポンスでは ID 列の型が揃わず merge できないので、マスタの型に合わせる
+        budgets['campaign_id'] = budgets['campaign_id'].astype(campaigns['campaign_id'].dtype)
+    master_df = campaigns.merge(budgets, on='campaign_id', how='left')
+    master_df['monthly_budget'] = master_df['monthly_budget'].fillna(0)
+    return compact_names(master_df)
+
+def compact_names(df, columns=NAME_COLUMNS):
+    for col in columns:
+        # pandas 3 の文字列型（str）と object 型の文字列列が対象
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype) and pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].astype('category')
+    return df
+
+def narrow_ints(df, columns=COUNTER_COLUMNS):
+    for col in columns:
+        values = df[col]
+        if values.dtype == np.int64 and (values.empty or (values.min() >= _INT32.min and values.max() <= _INT32.max)):
+            df[col] = values.astype(np.int32)
+    return df
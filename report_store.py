@@ -0,0 +1,140 @@
+import datetime
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+import report_parser
+
+# ローカルレポートストア（SQLite）
+# 日別・キャンペーン別の実績とキャンペーンマスタを API Key（のハッシュ）単位で保持し、
+# 未取得の日付だけを API から取り直せるようにする。
+
+STORE_PATH = os.environ.get("MICROAD_STORE_PATH", os.path.join("data", "microad_reports.sqlite3"))
+
+# campaign_id は API の型（数値/文字列）をそのまま保持したいので型指定なしにしている
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    key_hash TEXT NOT NULL,
+    campaign_id NOT NULL,
+    target_date TEXT NOT NULL,
+    net REAL NOT NULL DEFAULT 0,
+    gross REAL NOT NULL DEFAULT 0,
+    impression INTEGER NOT NULL DEFAULT 0,
+    click INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (key_hash, campaign_id, target_date)
+);
+CREATE TABLE IF NOT EXISTS campaigns (
+    key_hash TEXT NOT NULL,
+    campaign_id NOT NULL,
+    account_id,
+    account_name TEXT,
+    campaign_name TEXT,
+    PRIMARY KEY (key_hash, campaign_id)
+);
+CREATE TABLE IF NOT EXISTS charge_limits (
+    key_hash TEXT NOT NULL,
+    campaign_id NOT NULL,
+    month TEXT NOT NULL,
+    charge_limit REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (key_hash, campaign_id, month)
+);
+CREATE TABLE IF NOT EXISTS fetched_days (
+    key_hash TEXT NOT NULL,
+    target_date TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (key_hash, target_date)
+);
+"""
+
+def connect(path=STORE_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def date_key(day):
+    return day.strftime("%Y%m%d")
+
+def _iter_days(start, end):
+    day = start
+    while day <= end:
+        yield day
+        day += datetime.timedelta(days=1)
+
+def missing_ranges(conn, key_hash, start, end, refetch_days=0, today=None):
+    # [start, end] のうち未取得の日付を連続区間 [(s, e), ...] にまとめて返す。
+    # 直近 refetch_days 日は取得済みでも数値が確定していない可能性があるため取り直す。
+    today = today or datetime.date.today()
+    stale_from = today - datetime.timedelta(days=refetch_days)
+    rows = conn.execute(
+        "SELECT target_date FROM fetched_days WHERE key_hash = ? AND target_date BETWEEN ? AND ?",
+        (key_hash, date_key(start), date_key(end)),
+    ).fetchall()
+    fetched = {row[0] for row in rows}
+
+    ranges = []
+    for day in _iter_days(start, end):
+        if date_key(day) in fetched and day < stale_from:
+            continue
+        if ranges and ranges[-1][1] == day - datetime.timedelta(days=1):
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+def _rows(df, columns):
+    # numpy のスカラーは sqlite3 に渡せないので Python の値に変換して行にする
+    return zip(*(df[col].tolist() for col in columns))
+
+def save_frames(conn, key_hash, frames, start, end, today=None):
+    # 取得した [start, end] のレポート（ReportFrames）で保存内容を置き換える
+    today = today or datetime.date.today()
+    records = frames.records.assign(target_date=frames.records['target_date'].dt.strftime("%Y%m%d"))
+
+    # 当日以降は集計途中なので取得済みとして記録しない
+    fetched_at = time.time()
+    fetched_rows = [(key_hash, date_key(day), fetched_at) for day in _iter_days(start, end) if day < today]
+
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO campaigns VALUES (?, ?, ?, ?, ?)",
+            ((key_hash,) + row for row in _rows(frames.campaigns, report_parser.CAMPAIGN_COLUMNS)),
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO charge_limits VALUES (?, ?, ?, ?)",
+            ((key_hash,) + row for row in _rows(frames.limits, report_parser.LIMIT_COLUMNS)),
+        )
+        conn.execute(
+            "DELETE FROM records WHERE key_hash = ? AND target_date BETWEEN ? AND ?",
+            (key_hash, date_key(start), date_key(end)),
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((key_hash,) + row for row in _rows(records, report_parser.RECORD_COLUMNS)),
+        )
+        conn.executemany("INSERT OR REPLACE INTO fetched_days VALUES (?, ?, ?)", fetched_rows)
+
+def load_frames(conn, key_hash, start, end):
+    # 保存済みデータを ReportFrames（マスタ / 月別予算 / [start, end] の実績）で返す
+    campaigns = pd.read_sql_query(
+        "SELECT campaign_id, account_id, account_name, campaign_name FROM campaigns "
+        "WHERE key_hash = ? ORDER BY account_name, campaign_id",
+        conn, params=(key_hash,),
+    )
+    limits = pd.read_sql_query(
+        "SELECT campaign_id, month, charge_limit FROM charge_limits WHERE key_hash = ?",
+        conn, params=(key_hash,),
+    )
+    records = pd.read_sql_query(
+        "SELECT campaign_id, target_date, net, gross, impression, click FROM records "
+        "WHERE key_hash = ? AND target_date BETWEEN ? AND ? ORDER BY target_date, campaign_id",
+        conn, params=(key_hash, date_key(start), date_key(end)),
+        dtype={'net': 'float64', 'gross': 'float64', 'impression': 'int64', 'click': 'int64'},
+    )
+    records['target_date'] = pd.to_datetime(records['target_date'], format="%Y%m%d")
+    return report_parser.ReportFrames(campaigns, limits, report_parser.narrow_ints(records))
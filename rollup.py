@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+import report_parser
+
+# 集計キューブ
+# 実績を 1 回だけ集計し、キャンペーン別・アカウント別・全体合計の日別系列と累積値を
+# ID をキーに保持する。グラフ対象の切り替えは保持済みの行範囲を切り出すだけで済む。
+# 予算も対象ごと・月ごとに保持し、複数月の期間では月別予算を合算して扱う。
+
+SERIES_COLS = ['net', 'gross', 'impression', 'click']
+CUM_COLS = {'gross': 'cum_gross', 'impression': 'cum_imp', 'click': 'cum_click'}
+
+LEVEL_TOTAL = 'total'
+LEVEL_ACCOUNT = 'account'
+LEVEL_CAMPAIGN = 'campaign'
+
+def account_keys(master_df):
+    # アカウントID（無ければアカウント名）をアカウントのキーにする
+    if 'account_id' not in master_df.columns:
+        return master_df['account_name']
+    return master_df['account_id'].where(master_df['account_id'].notna(), master_df['account_name'])
+
+def _with_cumsum(daily, by):
+    # by ごとに日付順に並んだ日別系列に累積値を付与し、by ごとの行範囲を返す
+    cum = daily.groupby(by, sort=False)[list(CUM_COLS)].cumsum() if by else daily[list(CUM_COLS)].cumsum()
+    for col, cum_col in CUM_COLS.items():
+        daily[cum_col] = cum[col]
+    if not by:
+        return daily, {None: (0, len(daily))}
+    keys = daily[by].to_numpy()
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.array([], dtype=int)
+    stops = np.r_[starts[1:], len(keys)]
+    return daily, {keys[start]: (start, stop) for start, stop in zip(starts, stops)}
+
+class RollupCube:
+    def __init__(self, perf_df, master_df, limits, months):
+        # limits: 月別予算（campaign_id, month, charge_limit） / months: 期間にかかる月（"YYYYMM"）のリスト
+        # キャンペーン × 日付（実績を集計する唯一のパス）
+        campaign_daily = perf_df.groupby(['campaign_id', 'target_date'], sort=True)[SERIES_COLS].sum().reset_index()
+
+        master = master_df.drop_duplicates('campaign_id')
+        acc_keys = pd.Series(account_keys(master).to_numpy(), index=master['campaign_id'].to_numpy())
+
+        # アカウント × 日付 / 日付は、キャンペーン × 日付をさらにまとめるだけ
+        with_account = campaign_daily.assign(account_key=campaign_daily['campaign_id'].map(acc_keys))
+        account_daily = with_account.dropna(subset=['account_key']).groupby(['account_key', 'target_date'], sort=True)[SERIES_COLS].sum().reset_index()
+        total_daily = campaign_daily.groupby('target_date', sort=True)[SERIES_COLS].sum().reset_index()
+
+        self.campaign_daily, campaign_slices = _with_cumsum(campaign_daily, 'campaign_id')
+        # 累積値を付けた後は、日別のカウンタは int32 で足りる
+        report_parser.narrow_ints(self.campaign_daily)
+        account_daily, account_slices = _with_cumsum(account_daily, 'account_key')
+        total_daily, total_slices = _with_cumsum(total_daily, None)
+        self._frames = {
+            LEVEL_CAMPAIGN: (self.campaign_daily, campaign_slices),
+            LEVEL_ACCOUNT: (account_daily, account_slices),
+            LEVEL_TOTAL: (total_daily, total_slices),
+        }
+
+        # 対象 × 月の予算表（行: ID、列: "YYYYMM"）
+        month_limits = limits.loc[limits['month'].isin(months)].drop_duplicates(['campaign_id', 'month'], keep='last')
+        campaign_budgets = month_limits.pivot(index='campaign_id', columns='month', values='charge_limit')
+        campaign_budgets = campaign_budgets.reindex(index=master['campaign_id'], columns=months).fillna(0)
+        account_budgets = campaign_budgets.groupby(campaign_budgets.index.map(acc_keys)).sum()
+        total_budgets = pd.DataFrame([campaign_budgets.sum()], index=[None])
+        self._budgets = {
+            LEVEL_CAMPAIGN: campaign_budgets,
+            LEVEL_ACCOUNT: account_budgets,
+            LEVEL_TOTAL: total_budgets,
+        }
+
+        # キャンペーンID → アカウントのキー
+        self.account_of = acc_keys
+        self._labels = self._build_labels(master, acc_keys)
+
+    def _build_labels(self, master, acc_keys):
+        # 選択肢: 全体合計 → アカウント（名前順）→ キャンペーン（名前順）。
+        # 同名アカウントは取得元（複数の API Key をまとめた場合）と ID を、同名キャンペーンはアカウント名と ID を添えて区別する
+        labels = {(LEVEL_TOTAL, None): "全体合計"}
+        accounts = pd.DataFrame({
+            'key': acc_keys.to_numpy(), 'name': master['account_name'].to_numpy(),
+            'source': master['source'].to_numpy() if 'source' in master.columns else None,
+        })
+        accounts = accounts.drop_duplicates('key').sort_values('name', kind='stable')
+        duplicated = accounts['name'].duplicated(keep=False).to_numpy()
+        for key, name, source, dup in zip(accounts['key'], accounts['name'], accounts['source'], duplicated):
+            suffix = (f"（{source} / ID:{key}）" if source is not None else f"（ID:{key}）") if dup else ""
+            labels[(LEVEL_ACCOUNT, key)] = f"【アカウント】{name}{suffix}"
+
+        campaigns = master.sort_values('campaign_name', kind='stable')
+        duplicated = campaigns['campaign_name'].duplicated(keep=False).to_numpy()
+        for camp_id, name, acc_name, dup in zip(campaigns['campaign_id'], campaigns['campaign_name'], campaigns['account_name'], duplicated):
+            suffix = f"（{acc_name} / ID:{camp_id}）" if dup else ""
+            labels[(LEVEL_CAMPAIGN, camp_id)] = f"【キャンペーン】{name}{suffix}"
+        return labels
+
+    def nbytes(self):
+        # 保持している系列・予算表のメモリ使用量（バイト）
+        frames = [frame for frame, _ in self._frames.values()] + list(self._budgets.values())
+        return int(sum(frame.memory_usage(deep=True).sum() for frame in frames))
+
+    def options(self):
+        # グラフ対象の選択肢（(レベル, ID) のリスト）
+        return list(self._labels)
+
+    def label(self, option):
+        return self._labels.get(option, str(option))
+
+    def monthly_budgets(self, level, entity_id=None):
+        # 対象の月別予算（"YYYYMM" → 予算）
+        budgets = self._budgets[level]
+        if entity_id in budgets.index:
+            return budgets.loc[entity_id]
+        return pd.Series(0.0, index=budgets.columns)
+
+    def month_budgets(self, level, month):
+        # レベル内の全対象の、ある月（"YYYYMM"）の予算（ID → 予算。期間外の月なら 0）
+        budgets = self._budgets[level]
+        if month in budgets.columns:
+            return budgets[month]
+        return pd.Series(0.0, index=budgets.index)
+
+    def budget(self, level, entity_id=None):
+        return float(self.monthly_budgets(level, entity_id).sum())
+
+    def series(self, level, entity_id=None):
+        # 対象の日別系列と累積値（該当なしなら空の DataFrame）
+        frame, slices = self._frames[level]
+        start, stop = slices.get(entity_id, (0, 0))
+        return frame.iloc[start:stop][['target_date'] + SERIES_COLS + list(CUM_COLS.values())].reset_index(drop=True)
@@ -0,0 +1,274 @@
+import contextlib
+import datetime
+
+import streamlit as st
+
+import kpi
+import memory
+import metrics
+import pipeline
+import prefetch
+import table_view
+
+# ダッシュボードの表示区画
+# 操作用のウィジェットを持つ区画（予測・アラート、詳細テーブル、グラフ）は fragment にしてあり、
+# 区画内の操作では、その区画だけが再実行される（上のサマリや Styler の表は描き直さない）。
+# グラフの描画に使う plotly（charts）は、グラフの区画を初めて描画するときに読み込む。
+
+def session_cache():
+    # セッションごとの派生データ（グラフの系列・グラフ・予測）の LRU キャッシュ（上限 MICROAD_SESSION_CACHE_MB）
+    if 'frame_cache' not in st.session_state:
+        st.session_state['frame_cache'] = memory.LRUCache(memory.SESSION_CACHE_MB * 1024 * 1024)
+    return st.session_state['frame_cache']
+
+@contextlib.contextmanager
+def section_metrics(name, trace_memory=False):
+    # 区画ごとの計測（render_<区画>）。fragment は単独で再実行されるので区画の最後に出力し、
+    # デバッグ表示用に区画ごとの直近の記録をセッションに残す
+    run_metrics = metrics.RunMetrics(trace_memory=trace_memory)
+    with run_metrics.stage(f'render_{name}'):
+        yield run_metrics
+    run_metrics.emit()
+    st.session_state.setdefault('section_metrics', {})[name] = run_metrics.records()
+
+# --- 高速表示モードの列フォーマット ---
+def table_column_config(budget_label):
+    yen = st.column_config.NumberColumn(format="yen")
+    count = st.column_config.NumberColumn(format="localized")
+    diff = st.column_config.NumberColumn(format="%+d")
+    return {
+        budget_label: yen, '期間消化額': yen, '昨日消化': yen,
+        '進捗率(%)': st.column_config.NumberColumn(format="%.1f%%"),
+        '進捗前日比': st.column_config.NumberColumn(format="%+.1fpt"),
+        '乖離(pt)': st.column_config.NumberColumn(format="%+.1f"),
+        '消化前日比': diff, 'IMP前日比': diff, 'Click前日比': diff,
+        '期間IMP': count, '期間Click': count, '昨日IMP': count, '昨日Click': count,
+        '期間CTR': st.column_config.NumberColumn(format="%.2f%%"),
+        '昨日CTR': st.column_config.NumberColumn(format="%.2f%%"),
+        'CTR前日比': st.column_config.NumberColumn(format="%+.2fpt"),
+    }
+
+# --- 全体サマリ ---
+def summary_section(dashboard, trace_memory=False):
+    summary = dashboard['summary']
+    standard_pacing = summary['standard_pacing']
+    budget_label = dashboard['budget_label']
+    month_rollup_df = dashboard['month_rollup_df']
+    end_date = dashboard['end_date']
+    with section_metrics('summary', trace_memory):
+        st.markdown("---")
+
+        # 集計した時刻と鮮度
+        built_at = datetime.datetime.fromtimestamp(dashboard['built_at'])
+        age_minutes = (datetime.datetime.now() - built_at).total_seconds() / 60
+        source_label = "事前取得" if dashboard['source'] == 'prefetch' else "データ取得"
+        if dashboard['source'] == 'snapshot':
+            st.info(f"📦 {dashboard['snapshot_created_at'].replace('T', ' ')} 作成のスナップショットから表示しています（MicroAd には接続していません）。")
+        elif prefetch.is_stale(dashboard):
+            st.warning(f"⏱️ {built_at:%m/%d %H:%M} に集計したデータです（{age_minutes:,.0f} 分前・{source_label}）。最新の数値は「データ取得」で取り直してください。")
+        else:
+            st.caption(f"⏱️ {built_at:%m/%d %H:%M} 集計（{age_minutes:,.0f} 分前・{source_label}）")
+
+        # 複数の API Key をまとめた集計の取得元
+        master_df = dashboard['master_df']
+        if 'source' in master_df.columns and master_df['source'].nunique() > 1:
+            st.caption(f"🔑 {master_df['source'].nunique()} 件の API Key をまとめて集計: {' / '.join(map(str, master_df['source'].unique()))}")
+        if dashboard.get('failed_sources'):
+            st.warning(f"取得できなかった API Key（{'、'.join(dashboard['failed_sources'])}）を除いて集計しています。")
+
+        st.markdown("##### 💰 予算・消化状況（全体）")
+        r1c1, r1c2, r1c3, r1c4, r1c5 = st.columns(5)
+
+        r1c1.metric(f"{budget_label}合計", f"¥{summary['total_budget']:,.0f}")
+        r1c2.metric("合計消化額 (Gross)", f"¥{summary['total_gross']:,.0f}")
+        r1c3.metric("昨日の合計消化額", f"¥{summary['latest_gross']:,.0f}", f"{summary['diff_gross']:+,.0f} 円")
+        r1c4.metric("当月の理想進捗率" if month_rollup_df is None else "期間の理想進捗率", f"{standard_pacing:.1f}%", f"{end_date.month}/{end_date.day} 時点")
+        avg_prog = summary['avg_progress']
+        r1c5.metric("平均実績進捗率", f"{avg_prog:.1f}%", delta=f"{avg_prog - standard_pacing:.1f} pt")
+
+# --- 予算枯渇・着地予測とアラート ---
+@st.fragment
+def alerts_section(dashboard, trace_memory=False):
+    with section_metrics('alerts', trace_memory) as run_metrics:
+        st.markdown("##### 🚨 予測・アラート")
+        a1, a2, a3, a4 = st.columns(4)
+        burn_window = a4.number_input(
+            "消化ペースの集計日数（直近）", min_value=1, max_value=31, value=kpi.BURN_WINDOW_DAYS,
+            help="予算枯渇・着地予測に使う日別消化額の平均を、直近何日分でとるか",
+        )
+        # 全キャンペーン・アカウントの予測は集計日数ごとに 1 回だけ計算する
+        frame_cache = session_cache()
+        if ('alerts', burn_window) not in frame_cache:
+            with run_metrics.stage('exhaustion_forecast'):
+                frame_cache.put(('alerts', burn_window), pipeline.exhaustion_alerts(dashboard, burn_window))
+        alerts = frame_cache.get(('alerts', burn_window))
+
+        total_forecast = alerts['total']
+        if total_forecast is not None and total_forecast['burn_rate'] > 0:
+            days_to_exhaustion = total_forecast['days_to_exhaustion']
+            if days_to_exhaustion < total_forecast['days_remaining']:
+                a1.error(f"あと {days_to_exhaustion:.1f} 日で枯渇（{total_forecast['exhaustion_date']:%m/%d}）")
+            else:
+                a1.metric("予算枯渇予測", f"あと {days_to_exhaustion:.1f} 日")
+        else:
+            a1.metric("予算枯渇予測", "消化なし")
+        campaign_alerts = alerts['campaigns']
+        a2.metric("前倒し枯渇の見込み", f"{(campaign_alerts['risk'] == kpi.RISK_OVER).sum():,} 件")
+        a3.metric(f"未達見込み（着地{kpi.UNDER_DELIVERY_THRESHOLD}%未満）", f"{(campaign_alerts['risk'] == kpi.RISK_UNDER).sum():,} 件")
+
+        # 要注意の一覧（深刻度順。列名クリックで並べ替え）
+        alert_level = st.segmented_control("要注意の一覧", ["キャンペーン", "アカウント"], default="キャンペーン")
+        alert_df = alerts['accounts'] if alert_level == "アカウント" else campaign_alerts
+        if alert_df.empty:
+            st.caption("前倒し枯渇・未達の見込みはありません。")
+        else:
+            name_cols = ['account_name'] if alert_level == "アカウント" else ['account_name', 'campaign_name']
+            # 予測は終了日の月の予算・消化額で行うため、複数月の期間でも列は当月分
+            alert_display_df = alert_df[name_cols + [
+                'risk', 'risk_score', 'budget', 'spent', 'burn_rate', 'required_daily', 'pace_ratio',
+                'exhaustion_date', 'projected_spend', 'projected_progress'
+            ]].rename(columns={
+                'account_name': 'アカウント名', 'campaign_name': 'キャンペーン名', 'risk': 'リスク', 'risk_score': '深刻度',
+                'budget': '当月予算', 'spent': '当月消化額', 'burn_rate': '直近消化/日', 'required_daily': '必要消化/日',
+                'pace_ratio': 'ペース比', 'exhaustion_date': '枯渇予測日', 'projected_spend': '着地予測',
+                'projected_progress': '着地予測進捗率(%)',
+            })
+            yen = st.column_config.NumberColumn(format="yen")
+            st.dataframe(alert_display_df, hide_index=True, width="stretch", height=300, column_config={
+                '深刻度': st.column_config.ProgressColumn(format="%.2f", min_value=0, max_value=1),
+                '当月予算': yen, '当月消化額': yen, '直近消化/日': yen, '必要消化/日': yen, '着地予測': yen,
+                'ペース比': st.column_config.NumberColumn(format="%.2f"),
+                '枯渇予測日': st.column_config.DateColumn(format="YYYY-MM-DD"),
+                '着地予測進捗率(%)': st.column_config.NumberColumn(format="%.1f%%"),
+            })
+
+# --- インプレッション・クリック・平均指標・月別サマリ ---
+def activity_section(dashboard, trace_memory=False):
+    summary = dashboard['summary']
+    month_rollup_df = dashboard['month_rollup_df']
+    with section_metrics('activity', trace_memory):
+        st.markdown("##### 👁️ インプレッション・クリック状況 (全体合計)")
+        r2c1, r2c2, r2c3, r2c4 = st.columns(4)
+        r2c1.metric("期間合計IMP", f"{summary['total_imp']:,.0f}")
+        r2c2.metric("期間合計Click", f"{summary['total_click']:,.0f}")
+        r2c3.metric("昨日のIMP", f"{summary['latest_imp']:,.0f}", f"{summary['diff_imp']:+,.0f}")
+        r2c4.metric("昨日のClick", f"{summary['latest_click']:,.0f}", f"{summary['diff_click']:+,.0f}")
+
+        st.markdown("##### 📊 平均指標・効率 (全体平均)")
+        r3c1, r3c2, r3c3, r3c4 = st.columns(4)
+        r3c1.metric("平均IMP (日別)", f"{summary['daily_avg_imp']:,.0f}")
+        r3c2.metric("平均Click (日別)", f"{summary['daily_avg_click']:,.0f}")
+        r3c3.metric("平均CTR", f"{summary['ctr']:.2f}%")
+        r3c4.metric("平均CPM (仕入単価)", f"¥{summary['cpm']:,.0f}")
+
+        # 月別サマリ（複数月の期間のみ）
+        if month_rollup_df is not None:
+            st.markdown("##### 🗓️ 月別サマリ")
+            month_display_df = month_rollup_df[[
+                'month', 'monthly_budget', 'gross', 'progress_percent', 'pacing', 'diff_point',
+                'projected_gross', 'projected_progress', 'impression', 'click', 'period_ctr'
+            ]].copy()
+            month_display_df.columns = [
+                '月', '月別予算', '消化額', '進捗率(%)', '理想進捗率(%)', '乖離(pt)',
+                '着地予測', '着地予測進捗率(%)', 'IMP', 'Click', 'CTR'
+            ]
+            st.dataframe(month_display_df.style.format({
+                '月別予算': '¥{:,.0f}', '消化額': '¥{:,.0f}',
+                '進捗率(%)': '{:.1f}%', '理想進捗率(%)': '{:.1f}%', '乖離(pt)': '{:+.1f}',
+                '着地予測': '¥{:,.0f}', '着地予測進捗率(%)': '{:.1f}%',
+                'IMP': '{:,.0f}', 'Click': '{:,.0f}', 'CTR': '{:.2f}%'
+            }).map(table_view.color_diff_pacing, subset=['乖離(pt)']), width="stretch", hide_index=True)
+
+# --- 詳細テーブル ---
+@st.fragment
+def table_section(dashboard, trace_memory=False):
+    table_display_df = dashboard['table_display_df']
+    budget_label = dashboard['budget_label']
+    with section_metrics('table', trace_memory) as run_metrics:
+        st.markdown("---")
+        st.markdown("### 📋 キャンペーン別詳細")
+        st.caption("乖離： 🟦ハイペース(>+10) | ⬛順調 | 🟨警戒 | 🟥危険(<-10)")
+        st.info("💡 **表の右上にある虫眼鏡マーク🔍** や列名をクリックすることで、表の中で検索・並べ替えができます。")
+
+        # 高速表示モード: 絞り込み・並べ替え・ページ分割をサーバー側で行い、表示する 1 ページ分だけを送る
+        fast_table = st.toggle(
+            "高速表示モード（ページ分割・サーバー側で絞り込み）",
+            value=len(table_display_df) > table_view.FAST_TABLE_THRESHOLD,
+        )
+        if fast_table:
+            f1, f2, f3 = st.columns([2, 2, 3])
+            filter_accounts = f1.multiselect("アカウント", sorted(table_display_df['アカウント名'].dropna().unique()))
+            filter_bands = f2.multiselect("乖離区分", table_view.PACING_BANDS)
+            filter_query = f3.text_input("キャンペーン名で検索")
+
+            s1, s2, s3, s4 = st.columns(4)
+            sort_column = s1.selectbox("並べ替え", list(table_display_df.columns), index=table_display_df.columns.get_loc('乖離(pt)'))
+            sort_ascending = s2.toggle("昇順", value=True)
+            page_size = s3.selectbox("表示件数", table_view.PAGE_SIZES, index=1)
+            page_number = s4.number_input("ページ", min_value=1, value=1, step=1)
+
+            with run_metrics.stage('table_fast', rows=len(table_display_df)):
+                filtered_df = table_view.filter_table(table_display_df, filter_accounts, filter_bands, filter_query)
+                filtered_df = table_view.sort_table(filtered_df, sort_column, sort_ascending)
+                page_df, page_number, page_count = table_view.paginate(filtered_df, page_number, page_size)
+
+                if filtered_df.empty:
+                    st.caption("条件に一致するキャンペーンがありません。")
+                else:
+                    first_row = (page_number - 1) * page_size + 1
+                    st.caption(f"{len(filtered_df):,} 件中 {first_row:,}〜{first_row + len(page_df) - 1:,} 件を表示（{page_number} / {page_count} ページ）")
+                st.dataframe(page_df, column_config=table_column_config(budget_label), width="stretch", hide_index=True, height=600)
+        else:
+            # Styler の書式・色分けは st.dataframe での送信時に計算される
+            with run_metrics.stage('table_styling', rows=len(table_display_df)):
+                styled_df = table_view.style_table(table_display_df, budget_label)
+
+                st.dataframe(styled_df, width="stretch", height=600)
+
+# ========================================================
+# 📈 グラフ描画セクション
+# ========================================================
+@st.fragment
+def graph_section(dashboard, trace_memory=False):
+    # plotly の読み込みはグラフを描画するときまで遅らせる
+    import charts
+
+    cube = dashboard['cube']
+    start_date = dashboard['start_date']
+    end_date = dashboard['end_date']
+    frame_cache = session_cache()
+    with section_metrics('graph', trace_memory) as run_metrics:
+        st.markdown("---")
+        st.markdown("### 📈 詳細分析（グラフ）")
+
+        # 選択肢は (レベル, ID) で持ち、表示名だけを整形する（同名キャンペーンも取り違えない）
+        selected_graph_item = st.selectbox("グラフを表示する対象を選択", cube.options(), format_func=cube.label)
+
+        g_col1, g_col2 = st.columns([3, 1])
+        with g_col1:
+            # 選択したグラフだけを組み立てて描画する
+            shown_charts = st.segmented_control(
+                "表示するグラフ", list(charts.CHART_TITLES), selection_mode="multi",
+                default=[charts.CHART_PROGRESS], format_func=lambda chart_id: charts.CHART_TITLES[chart_id],
+            )
+        with g_col2:
+            use_downsample = st.toggle("間引き表示", value=False, help=f"1系列あたり最大{charts.DOWNSAMPLE_POINTS}点に間引いて描画します")
+
+        # 系列（理想線・予測を含む）と組み立て済みのグラフは (対象, 期間) ごとにセッション内で使い回す
+        series_key = ('series', selected_graph_item, start_date, end_date)
+        if series_key not in frame_cache:
+            with run_metrics.stage('series'):
+                frame_cache.put(series_key, charts.prepare_series(cube, selected_graph_item, start_date))
+        series = frame_cache.get(series_key)
+
+        # グラフ描画
+        if series is not None:
+            for chart_id in shown_charts or []:
+                figure_key = ('figure',) + series_key[1:] + (chart_id, use_downsample)
+                if figure_key not in frame_cache:
+                    with run_metrics.stage(f'figure_{chart_id}', rows=len(series['target_data'])):
+                        frame_cache.put(figure_key, charts.build_figure(chart_id, series, use_downsample))
+                st.subheader(charts.CHART_TITLES[chart_id])
+                st.plotly_chart(frame_cache.get(figure_key), width="stretch")
+        else:
+            st.info("📊 グラフを表示するためのデータがありません。")
@@ -0,0 +1,132 @@
+import datetime
+import io
+import json
+import os
+import uuid
+import zipfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import report_parser
+
+# スナップショット
+# 取得したレポート（キャンペーンマスタ・月別予算・日別実績）と計算済みの KPI テーブルを列指向のファイルに書き出し、
+# API に問い合わせずにダッシュボードを作り直せるようにする。ダウンロード用には zip 1 つにまとめ、
+# サーバーに保存する場合はディレクトリに置く。ディレクトリの Arrow / Parquet はメモリマップで読むので、
+# 大きなスナップショットでも開くだけならほとんどメモリを使わない。
+# サーバーの保存先は API Key の組み合わせ（pipeline.sources_hash）ごとに分け、一覧もその中だけを返す。
+
+SNAPSHOT_DIR = os.environ.get("MICROAD_SNAPSHOT_DIR", os.path.join("data", "snapshots"))
+SNAPSHOT_VERSION = 1
+
+# 形式 → 拡張子
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow', 'csv': '.csv'}
+META_FILE = 'meta.json'
+
+def snapshot_tables(dashboard):
+    # ダッシュボードから書き出す表（campaigns / limits / records は作り直しに使い、kpi は分析用）
+    return {
+        # 複数の API Key をまとめたものは取得元も残す
+        'campaigns': dashboard['master_df'][[col for col in report_parser.CAMPAIGN_COLUMNS + ['source'] if col in dashboard['master_df'].columns]],
+        'limits': dashboard['limits_df'],
+        # 実績はキャンペーン × 日付で 1 行なので、cube のキャンペーン別日別系列がそのまま元の実績になる
+        'records': dashboard['cube'].campaign_daily[report_parser.RECORD_COLUMNS],
+        'kpi': dashboard['table_display_df'],
+    }
+
+def _meta(dashboard, fmt):
+    return {
+        'version': SNAPSHOT_VERSION,
+        'format': fmt,
+        'start_date': dashboard['start_date'].isoformat(),
+        'end_date': dashboard['end_date'].isoformat(),
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+
+def write_table(df, fmt, sink):
+    # 1 つの表を sink（バイナリのファイルオブジェクト）に書き出す。CSV は Excel で開けるように BOM 付き UTF-8
+    if fmt == 'csv':
+        sink.write(df.to_csv(index=False).encode('utf-8-sig'))
+        return
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if fmt == 'parquet':
+        pq.write_table(table, sink)
+    else:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+def table_bytes(df, fmt):
+    buffer = io.BytesIO()
+    write_table(df, fmt, buffer)
+    return buffer.getvalue()
+
+def archive_bytes(dashboard, fmt='parquet'):
+    # スナップショット一式（meta.json と各表）の zip。Parquet は圧縮済みなので zip では圧縮しない
+    buffer = io.BytesIO()
+    compression = zipfile.ZIP_STORED if fmt == 'parquet' else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(buffer, 'w', compression) as zf:
+        zf.writestr(META_FILE, json.dumps(_meta(dashboard, fmt), ensure_ascii=False))
+        for name, df in snapshot_tables(dashboard).items():
+            with zf.open(name + FORMATS[fmt], 'w') as f:
+                write_table(df, fmt, f)
+    return buffer.getvalue()
+
+def save(dashboard, scope, fmt='arrow', directory=SNAPSHOT_DIR):
+    # サーバー上の directory/<scope>/<期間>_<作成時刻>_<形式>_<一意な接尾辞>/ に保存し、そのパスを返す
+    # （scope は API Key の組み合わせのハッシュ。同じ秒に保存しても別のディレクトリになる）
+    meta = _meta(dashboard, fmt)
+    created_at = datetime.datetime.fromisoformat(meta['created_at'])
+    name = f"{dashboard['start_date']:%Y%m%d}-{dashboard['end_date']:%Y%m%d}_{created_at:%Y%m%d%H%M%S}_{fmt}_{uuid.uuid4().hex[:8]}"
+    path = os.path.join(directory, scope, name)
+    os.makedirs(path)
+    for name, df in snapshot_tables(dashboard).items():
+        with open(os.path.join(path, name + FORMATS[fmt]), 'wb') as f:
+            write_table(df, fmt, f)
+    # meta.json は最後に書く（途中で失敗したものは一覧に出さない）
+    with open(os.path.join(path, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return path
+
+def list_saved(scope, directory=SNAPSHOT_DIR):
+    # scope（API Key の組み合わせのハッシュ）に保存済みのスナップショットのパス（新しい順）
+    scope_dir = os.path.join(directory, scope)
+    if not os.path.isdir(scope_dir):
+        return []
+    paths = [os.path.join(scope_dir, name) for name in os.listdir(scope_dir)]
+    return sorted((path for path in paths if os.path.exists(os.path.join(path, META_FILE))), reverse=True)
+
+def read_table(source, fmt):
+    # source はファイルのパス（Arrow / Parquet はメモリマップで開く）またはバイト列
+    if fmt == 'csv':
+        df = pd.read_csv(source if isinstance(source, str) else io.BytesIO(source), encoding='utf-8-sig', dtype={'month': str})
+        if 'target_date' in df.columns:
+            df['target_date'] = pd.to_datetime(df['target_date'])
+        return df
+    if fmt == 'parquet':
+        table = pq.read_table(source if isinstance(source, str) else pa.BufferReader(source), memory_map=isinstance(source, str))
+    else:
+        stream = pa.memory_map(source) if isinstance(source, str) else pa.BufferReader(source)
+        table = pa.ipc.open_file(stream).read_all()
+    # 列ごとに別ブロックにすると、欠損のない数値列はメモリマップ上のデータをコピーせずに参照できる
+    return table.to_pandas(split_blocks=True)
+
+def load(source):
+    # 保存済みのディレクトリのパス、または zip（パス・アップロードされたファイル）から
+    # 作り直しに使う ReportFrames とメタ情報を返す
+    if isinstance(source, str) and os.path.isdir(source):
+        with open(os.path.join(source, META_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+        read = lambda name: read_table(os.path.join(source, name + FORMATS[meta['format']]), meta['format'])
+        frames = report_parser.ReportFrames(read('campaigns'), read('limits'), read('records'))
+    else:
+        with zipfile.ZipFile(source) as zf:
+            meta = json.loads(zf.read(META_FILE))
+            read = lambda name: read_table(zf.read(name + FORMATS[meta['format']]), meta['format'])
+            frames = report_parser.ReportFrames(read('campaigns'), read('limits'), read('records'))
+    if meta.get('version', 0) > SNAPSHOT_VERSION:
+        raise ValueError(f"新しい形式のスナップショットです（version {meta['version']}）")
+    meta['start_date'] = datetime.date.fromisoformat(meta['start_date'])
+    meta['end_date'] = datetime.date.fromisoformat(meta['end_date'])
+    return frames._replace(records=report_parser.narrow_ints(frames.records)), meta
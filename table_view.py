@@ -0,0 +1,103 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# キャンペーン別詳細テーブルの絞り込み・並べ替え・ページ分割
+# セル単位の Styler を使わず、ステータス列を事前に計算しておき、表示する 1 ページ分だけを切り出す。
+
+# 乖離(pt) の区分（color_diff_pacing と同じ閾値）
+PACING_BANDS = ['🟦ハイペース', '⬛順調', '🟨警戒', '🟥危険']
+
+PAGE_SIZES = [50, 100, 200, 500]
+
+# この行数を超えたら高速表示モードを既定にする
+FAST_TABLE_THRESHOLD = 1000
+
+# 詳細テーブルの列（集計結果の列名 → 表示名）。予算列の表示名は期間によって変わるので別に渡す
+DISPLAY_COLUMNS = {
+    'account_name': 'アカウント名', 'campaign_name': 'キャンペーン名', 'monthly_budget': None, 'gross': '期間消化額',
+    'progress_percent': '進捗率(%)', 'daily_progress_diff': '進捗前日比', 'diff_point': '乖離(pt)',
+    'latest_gross': '昨日消化', 'diff_gross': '消化前日比',
+    'impression': '期間IMP', 'click': '期間Click', 'period_ctr': '期間CTR',
+    'latest_imp': '昨日IMP', 'diff_imp': 'IMP前日比',
+    'latest_click': '昨日Click', 'diff_click': 'Click前日比',
+    'latest_ctr': '昨日CTR', 'diff_ctr': 'CTR前日比',
+}
+
+def display_table(merged_df, budget_label):
+    # キャンペーン別 KPI を表示用の列名・列順に並べ、乖離(pt) の直後にステータス列を加える
+    display_df = merged_df[list(DISPLAY_COLUMNS)]
+    display_df.columns = [budget_label if name is None else name for name in DISPLAY_COLUMNS.values()]
+
+    # 乖離の区分は描画のたびにセル単位で判定せず、ステータス列として持っておく
+    display_df.insert(display_df.columns.get_loc('乖離(pt)') + 1, 'ステータス', pacing_bands(display_df['乖離(pt)']))
+
+    # 複数の API Key をまとめて表示するときは、先頭に取得元を出す
+    if 'source' in merged_df.columns and merged_df['source'].nunique() > 1:
+        display_df.insert(0, '取得元', merged_df['source'].to_numpy())
+    return display_df
+
+# --- 色分けロジック ---
+def color_diff_pacing(val):
+    if val > 10: return 'color: blue; font-weight: bold;'
+    elif 0 <= val <= 10: return 'color: black;'
+    elif -10 <= val < 0: return 'color: #D4AC0D; font-weight: bold;'
+    else: return 'color: red; font-weight: bold;'
+
+def color_day_diff(val):
+    if val > 0: return 'color: blue; font-weight: bold;'
+    elif val < 0: return 'color: red; font-weight: bold;'
+    else: return 'color: black;'
+
+def style_table(display_df, budget_label):
+    # 全件表示用の Styler（セル単位の書式と色分け）
+    return display_df.style.format({
+        budget_label: '¥{:,.0f}', '期間消化額': '¥{:,.0f}',
+        '進捗率(%)': '{:.1f}%', '進捗前日比': '{:+.1f}pt', '乖離(pt)': '{:+.1f}',
+        '昨日消化': '¥{:,.0f}', '消化前日比': '{:+,.0f}',
+        '期間IMP': '{:,.0f}', '期間Click': '{:,.0f}', '期間CTR': '{:.2f}%',
+        '昨日IMP': '{:,.0f}', 'IMP前日比': '{:+,.0f}',
+        '昨日Click': '{:,.0f}', 'Click前日比': '{:+,.0f}',
+        '昨日CTR': '{:.2f}%', 'CTR前日比': '{:+.2f}pt'
+    }).map(color_diff_pacing, subset=['乖離(pt)'])\
+      .map(color_day_diff, subset=['消化前日比', 'IMP前日比', 'Click前日比', 'CTR前日比'])
+
+def pacing_bands(diff_point):
+    # 乖離(pt) を区分ラベルに変換する（>+10 / 0〜+10 / -10〜0 / <-10）
+    values = np.asarray(diff_point, dtype=float)
+    labels = np.select(
+        [values > 10, values >= 0, values >= -10],
+        PACING_BANDS[:3],
+        default=PACING_BANDS[3],
+    )
+    return pd.Categorical(labels, categories=PACING_BANDS)
+
+def filter_table(df, accounts=None, bands=None, query=""):
+    # アカウント・乖離区分・キャンペーン名（部分一致、大文字小文字を区別しない）で絞り込む
+    mask = np.ones(len(df), dtype=bool)
+    if accounts:
+        mask &= df['アカウント名'].isin(accounts).to_numpy()
+    if bands:
+        mask &= df['ステータス'].isin(bands).to_numpy()
+    if query:
+        names = df['キャンペーン名']
+        if isinstance(names.dtype, pd.CategoricalDtype):
+            # カテゴリ型は名前の種類ごとに 1 回だけ判定する（コード -1 の欠損は末尾の False に当たる）
+            hits = np.asarray(names.cat.categories.astype(str).str.contains(query, case=False, regex=False), dtype=bool)
+            mask &= np.append(hits, False)[names.cat.codes.to_numpy()]
+        else:
+            mask &= names.astype(str).str.contains(query, case=False, regex=False, na=False).to_numpy()
+    return df[mask]
+
+def sort_table(df, column, ascending=True):
+    if column not in df.columns:
+        return df
+    return df.sort_values(column, ascending=ascending, kind='stable', na_position='last')
+
+def paginate(df, page, page_size):
+    # 1 始まりのページ番号で 1 ページ分を返す（ページ数と実際のページ番号も返す）
+    page_count = max(math.ceil(len(df) / page_size), 1)
+    page = min(max(int(page), 1), page_count)
+    start = (page - 1) * page_size
+    return df.iloc[start:start + page_size], page, page_count
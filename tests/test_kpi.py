@@ -0,0 +1,141 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import kpi
+import pipeline
+import report_parser
+
+# 1か月（2026年10月・31日）の期間で、元のダッシュボード（app.py 内の計算）と同じ値になることを確かめる
+
+START = datetime.date(2026, 10, 1)
+END = datetime.date(2026, 10, 10)
+
+@pytest.fixture
+def campaign_daily():
+    # キャンペーン 1: 10/1〜10/9 は 1,000 円・10,000 IMP・100 Click、10/10 は 1,500 円・12,000 IMP・150 Click
+    # キャンペーン 2: 10/10 のみ 500 円・IMP なし（予算なし）
+    dates = pd.date_range('2026-10-01', '2026-10-10')
+    rows = [(1, day, 800.0, 1000.0, 10000, 100) for day in dates[:-1]]
+    rows += [(1, dates[-1], 1200.0, 1500.0, 12000, 150), (2, dates[-1], 400.0, 500.0, 0, 0)]
+    return pd.DataFrame(rows, columns=report_parser.RECORD_COLUMNS)
+
+@pytest.fixture
+def master_df():
+    campaigns = pd.DataFrame({
+        'campaign_id': [1, 2], 'account_id': [10, 10],
+        'account_name': ['A', 'A'], 'campaign_name': ['c1', 'c2'],
+    })
+    limits = pd.DataFrame({'campaign_id': [1], 'month': ['202610'], 'charge_limit': [31000.0]})
+    return report_parser.build_master(campaigns, limits, ['202610']), limits
+
+def test_safe_divide_zero_and_nan_denominators():
+    assert kpi.safe_divide(1, 0) == 0.0
+    assert kpi.safe_divide(1, np.nan) == 0.0
+    assert kpi.safe_divide(3, 4, 100) == 75.0
+    result = kpi.safe_divide(pd.Series([1.0, 2.0, 3.0, 4.0], index=list('abcd')), [2, 0, np.nan, -1])
+    assert list(result.index) == list('abcd')
+    assert result.tolist() == [0.5, 0.0, 0.0, 0.0]
+
+def test_daily_diff(campaign_daily):
+    diff = kpi.daily_diff(campaign_daily).set_index('campaign_id')
+    first = diff.loc[1]
+    assert first['latest_gross'] == 1500
+    assert first['diff_gross'] == 500
+    assert first['latest_imp'] == 12000
+    assert first['diff_imp'] == 2000
+    assert first['diff_click'] == 50
+    assert first['latest_ctr'] == pytest.approx(1.25)
+    assert first['diff_ctr'] == pytest.approx(0.25)
+    # 前日の実績がないキャンペーンは前日を 0 とし、IMP 0 の CTR は 0
+    second = diff.loc[2]
+    assert second['diff_gross'] == 500
+    assert second['latest_ctr'] == 0
+    assert second['diff_ctr'] == 0
+
+def test_daily_diff_empty():
+    empty = pd.DataFrame(columns=report_parser.RECORD_COLUMNS)
+    assert list(kpi.daily_diff(empty).columns) == kpi.DAILY_DIFF_COLUMNS
+
+def test_campaign_kpis_single_month(campaign_daily, master_df):
+    master, limits = master_df
+    monthly = kpi.monthly_kpis(campaign_daily, master, limits, START, END)
+    merged = kpi.campaign_kpis(campaign_daily, master, monthly).set_index('campaign_id')
+
+    standard_pacing = 10 / 31 * 100
+    first = merged.loc[1]
+    assert first['gross'] == 10500
+    assert first['ideal_progress'] == pytest.approx(standard_pacing)
+    assert first['progress_percent'] == pytest.approx(10500 / 31000 * 100)
+    assert first['daily_progress_diff'] == pytest.approx(1500 / 31000 * 100)
+    assert first['diff_point'] == pytest.approx(10500 / 31000 * 100 - standard_pacing)
+    assert first['period_ctr'] == pytest.approx(1050 / 102000 * 100)
+    assert first['period_cpm'] == pytest.approx(10500 / 102000 * 1000)
+
+    # 予算なしのキャンペーンは進捗 0、乖離は理想進捗率の分だけマイナス
+    second = merged.loc[2]
+    assert second['progress_percent'] == 0
+    assert second['diff_point'] == pytest.approx(-standard_pacing)
+    assert second['period_ctr'] == 0
+
+def test_ideal_line_single_month():
+    ideal = kpi.ideal_line(pd.Series({'202610': 31000.0}))
+    assert len(ideal) == 31
+    assert ideal['date'].iloc[0] == pd.Timestamp('2026-10-01')
+    assert ideal['date'].iloc[-1] == pd.Timestamp('2026-10-31')
+    np.testing.assert_allclose(ideal['ideal_progress'], np.arange(1, 32) / 31 * 100)
+    np.testing.assert_allclose(ideal['ideal_daily_gross'], 1000)
+    np.testing.assert_allclose(ideal['ideal_daily_click'], 10)
+    np.testing.assert_allclose(ideal['ideal_cum_click'], np.arange(1, 32) * 10)
+
+def test_ideal_line_without_budget_is_day_proportional():
+    ideal = kpi.ideal_line(pd.Series({'202610': 0.0}))
+    np.testing.assert_allclose(ideal['ideal_progress'], np.arange(1, 32) / 31 * 100)
+    np.testing.assert_allclose(ideal['ideal_cum_click'], 0)
+
+def test_forecast_single_month():
+    state = pd.DataFrame({
+        'latest_date': [pd.Timestamp('2026-10-10')], 'cum_gross': [10500.0], 'cum_click': [1050.0], 'budget': [31000.0],
+    })
+    result = kpi.forecast(state, START, pd.Timestamp('2026-10-31'))
+    assert len(result) == 21
+    assert result['date'].iloc[0] == pd.Timestamp('2026-10-11')
+    assert result['date'].iloc[-1] == pd.Timestamp('2026-10-31')
+    # 現状ペース（1日あたり 1,050 円・105 Click）のまま月末まで
+    assert result['forecast_cum_gross'].iloc[-1] == pytest.approx(10500 + 1050 * 21)
+    assert result['forecast_cum_click'].iloc[-1] == pytest.approx(1050 + 105 * 21)
+    assert result['forecast_progress'].iloc[-1] == pytest.approx((10500 + 1050 * 21) / 31000 * 100)
+    # 残予算を残り日数で割った必要ペース
+    np.testing.assert_allclose(result['req_daily_click'], (31000 - 10500) / 21 / 100)
+    assert result['recovery_progress'].iloc[-1] == pytest.approx(100)
+
+def test_forecast_without_remaining_days():
+    state = pd.DataFrame({
+        'latest_date': [pd.Timestamp('2026-10-31')], 'cum_gross': [1.0], 'cum_click': [1.0], 'budget': [1.0],
+    })
+    assert kpi.forecast(state, START, pd.Timestamp('2026-10-31')).empty
+
+def _sep_oct_frames():
+    # 9月 3,000 円・10月 1,000 円の予算で、10/1〜10/10 に 1 日 80 円を消化
+    campaigns = pd.DataFrame([(1, 10, 'A', 'c1')], columns=report_parser.CAMPAIGN_COLUMNS)
+    limits = pd.DataFrame({'campaign_id': [1, 1], 'month': ['202609', '202610'], 'charge_limit': [3000.0, 1000.0]})
+    records = pd.DataFrame(
+        [(1, day, 80.0, 80.0, 100, 1) for day in pd.date_range('2026-10-01', '2026-10-10')],
+        columns=report_parser.RECORD_COLUMNS,
+    )
+    return report_parser.ReportFrames(campaigns, limits, records)
+
+@pytest.mark.parametrize('start', [datetime.date(2026, 9, 1), START])
+def test_exhaustion_forecast_uses_end_month_budget(start):
+    # 9月からの期間でも、10月の予算（1,000 円）と10月の消化額（800 円）で予測し、10月だけの期間と同じになる
+    dashboard = pipeline.build_dashboard(_sep_oct_frames(), start, END)
+    alerts = pipeline.exhaustion_alerts(dashboard)
+    total = alerts['total']
+    assert total['budget'] == 1000
+    assert total['spent'] == 800
+    assert total['remaining_budget'] == 200
+    assert total['days_to_exhaustion'] == pytest.approx(2.5)
+    assert alerts['campaigns']['risk'].tolist() == [kpi.RISK_OVER]
+    assert alerts['accounts']['risk'].tolist() == [kpi.RISK_OVER]
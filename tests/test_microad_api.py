@@ -0,0 +1,67 @@
+import datetime
+import socket
+import time
+
+import pandas as pd
+import pytest
+
+import microad_api
+import report_parser
+from benchmarks.stub_server import StubServer
+from benchmarks.synthetic import SyntheticReport
+
+START = datetime.date(2026, 9, 20)
+END = datetime.date(2026, 10, 10)
+
+@pytest.fixture(scope='module')
+def report():
+    return SyntheticReport(50, campaigns_per_account=10)
+
+def _client(url, **kwargs):
+    # バックオフは大きくしておき、Retry-After に従わなければテストが終わらないようにする
+    options = dict(max_workers=2, window_days=7, max_retries=2, backoff=60, max_backoff=60)
+    options.update(kwargs)
+    return microad_api.MicroAdClient("test", base_url=url, **options)
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_retry_honours_retry_after(report, status):
+    with StubServer(report, error_rate=1.0, error_statuses=(status,), retry_after=0.2) as stub:
+        started = time.monotonic()
+        with _client(stub.url) as client, pytest.raises(microad_api.MicroAdAPIError) as excinfo:
+            client.fetch_window(START, START)
+        elapsed = time.monotonic() - started
+    assert excinfo.value.status_code == status
+    # 初回 + max_retries 回を、Retry-After の 0.2 秒ずつ空けて送る
+    assert client.requests_sent == stub.stats['requests'] == 3
+    assert 0.4 <= elapsed < 10
+
+def test_no_retry_on_client_error(report):
+    with StubServer(report) as stub:
+        with _client(stub.url + "/unknown") as client, pytest.raises(microad_api.MicroAdAPIError) as excinfo:
+            client.fetch_window(START, START)
+    assert excinfo.value.status_code == 404
+    assert stub.stats['requests'] == 1
+
+def test_connection_refused_gives_up_after_max_retries():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    with _client(f"http://127.0.0.1:{port}/v2/reports", backoff=0.01, max_backoff=0.01) as client:
+        with pytest.raises(microad_api.MicroAdAPIError) as excinfo:
+            client.fetch_window(START, START)
+    assert excinfo.value.status_code is None
+    assert client.requests_sent == 3
+
+def test_fetch_range_matches_single_payload(report):
+    # ウィンドウ単位で（429 / 503 を挟みながら）取得して結合した結果は、期間全体を 1 回でパースした結果と同じ
+    expected = report_parser.parse_payload(report.payload(START, END))
+    with StubServer(report, error_rate=0.5, retry_after=0.01, seed=1) as stub:
+        with _client(stub.url, window_days=3, max_retries=20, backoff=0.01, max_backoff=0.01) as client:
+            frames = client.fetch_range(START, END)
+    assert stub.stats['errors'] > 0
+
+    # 月別予算・実績の行の順序はウィンドウの分け方で変わるので、キーで並べて比べる
+    sort = lambda df, keys: df.sort_values(keys, kind='stable').reset_index(drop=True)
+    pd.testing.assert_frame_equal(frames.campaigns, expected.campaigns)
+    pd.testing.assert_frame_equal(sort(frames.limits, ['campaign_id', 'month']), sort(expected.limits, ['campaign_id', 'month']))
+    pd.testing.assert_frame_equal(sort(frames.records, ['target_date', 'campaign_id']), sort(expected.records, ['target_date', 'campaign_id']))
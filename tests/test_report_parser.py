@@ -0,0 +1,94 @@
+import datetime
+import json
+
+import pandas as pd
+import pytest
+
+import pipeline
+import report_parser
+
+def test_build_master_empty_payload():
+    # アカウントも実績もないレスポンスでも例外にせず、空のマスタを返す
+    frames = report_parser.parse_payload({})
+    master_df = report_parser.build_master(frames.campaigns, frames.limits, ['202610'])
+    assert master_df.empty
+    assert 'monthly_budget' in master_df.columns
+    assert pipeline.build_dashboard(frames, datetime.date(2026, 10, 1), datetime.date(2026, 10, 10)) is None
+
+def test_build_master_records_without_accounts():
+    frames = report_parser.parse_payload({
+        'report': {'records': [{'campaign_id': 1, 'target_date': '20261001', 'gross': '100', 'impression': 10, 'click': 1}]},
+    })
+    master_df = report_parser.build_master(frames.campaigns, frames.limits, ['202610'])
+    assert master_df.empty
+    dashboard = pipeline.build_dashboard(frames, datetime.date(2026, 10, 1), datetime.date(2026, 10, 1))
+    assert dashboard['summary']['total_gross'] == 100
+    assert dashboard['summary']['total_budget'] == 0
+
+def test_build_master_names_are_categorical():
+    # pandas 3 の文字列型（str）の名前列も category に変換して、キャンペーン数分の文字列を持たない
+    campaigns = pd.DataFrame(
+        [(i, i % 2, f"acc{i % 2}", f"camp{i}") for i in range(4)], columns=report_parser.CAMPAIGN_COLUMNS,
+    )
+    limits = pd.DataFrame(columns=report_parser.LIMIT_COLUMNS)
+    master_df = report_parser.build_master(campaigns, limits, ['202610'])
+    assert isinstance(master_df['account_name'].dtype, pd.CategoricalDtype)
+    assert isinstance(master_df['campaign_name'].dtype, pd.CategoricalDtype)
+    assert list(master_df['account_name'].cat.categories) == ['acc0', 'acc1']
+
+# parse_stream（チャンク単位の読み取り）は、どこでチャンクが切れても parse_payload と同じ結果になる
+STREAM_PAYLOADS = {
+    'multibyte_and_brackets': {
+        'account': [
+            {'id': 10, 'name': '広告主]A}', 'campaign': [
+                {'id': 1, 'name': 'キャンペーン[春]{1}', 'campaign_monthly_charge_limit': [{'month': '202610', 'charge_limit': '31000'}]},
+                {'id': 2, 'name': '"引用"と\\', 'campaign_monthly_charge_limit': None},
+            ]},
+            {'id': 20, 'name': 'B', 'campaign': None},
+        ],
+        'report': {'total': 3, 'records': [
+            {'campaign_id': 1, 'target_date': '20261001', 'net': '80', 'gross': '100', 'impression': 1000, 'click': 10, 'memo': 'a]b}'},
+            {'campaign_id': 2, 'target_date': 20261001, 'net': 1.5, 'gross': 2.5, 'impression': 30, 'click': 1},
+            {'campaign_id': 1, 'target_date': '2026-10-02', 'net': None, 'gross': 'x', 'impression': 12, 'click': 0},
+        ]},
+    },
+    'report_before_account': {
+        'report': {'records': [{'campaign_id': 1, 'target_date': '20261001', 'net': 1, 'gross': 2, 'impression': 3, 'click': 4}]},
+        'account': [{'id': 10, 'name': 'A', 'campaign': [{'id': 1, 'name': 'c1'}]}],
+    },
+    'campaigns_before_account_fields': {
+        'account': [
+            {'campaign': [{'id': 1, 'name': 'c1'}, {'id': 2, 'name': 'c2'}], 'id': 10, 'name': 'A'},
+            {'campaign': [{'id': 3, 'name': 'c3'}], 'id': 20},
+            {'id': 30, 'campaign': [{'id': 4, 'name': 'c4'}], 'name': 'C'},
+        ],
+        'report': {'records': []},
+    },
+    'null_arrays': {'account': None, 'report': {'records': None}},
+    'empty': {},
+}
+
+def _chunks(data, size):
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+def _assert_frames_equal(actual, expected):
+    for name in report_parser.ReportFrames._fields:
+        pd.testing.assert_frame_equal(getattr(actual, name), getattr(expected, name))
+
+@pytest.mark.parametrize('size', [1, 7, 64, 1 << 20])
+@pytest.mark.parametrize('name', list(STREAM_PAYLOADS))
+def test_parse_stream_matches_parse_payload(name, size):
+    data = STREAM_PAYLOADS[name]
+    _assert_frames_equal(report_parser.parse_stream(_chunks(data, size)), report_parser.parse_payload(data))
+
+def test_parse_stream_campaigns_before_account_fields():
+    frames = report_parser.parse_stream(_chunks(STREAM_PAYLOADS['campaigns_before_account_fields'], 3))
+    assert frames.campaigns['campaign_id'].tolist() == [1, 2, 3, 4]
+    assert frames.campaigns['account_id'].tolist() == [10, 10, 20, 30]
+    assert frames.campaigns['account_name'].tolist() == ['A', 'A', 'Unknown', 'C']
+
+def test_parse_stream_truncated_body():
+    body = json.dumps(STREAM_PAYLOADS['multibyte_and_brackets'], ensure_ascii=False).encode('utf-8')
+    with pytest.raises(ValueError):
+        report_parser.parse_stream([body[:len(body) // 2]])
@@ -0,0 +1,77 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import report_parser
+import report_store
+
+KEY = 'key-hash'
+TODAY = datetime.date(2026, 10, 8)
+
+def day(n):
+    return datetime.date(2026, 10, n)
+
+def _frames(days, gross=100.0):
+    return report_parser.parse_payload({
+        'account': [{'id': 10, 'name': 'A', 'campaign': [
+            {'id': 1, 'name': 'c1', 'campaign_monthly_charge_limit': [{'month': '202610', 'charge_limit': 31000}]},
+        ]}],
+        'report': {'records': [
+            {'campaign_id': 1, 'target_date': d.strftime('%Y%m%d'), 'net': gross * 0.8, 'gross': gross, 'impression': 1000, 'click': 10}
+            for d in days
+        ]},
+    })
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = report_store.connect(str(tmp_path / 'store.sqlite3'))
+    yield conn
+    conn.close()
+
+def test_missing_ranges_empty_store(conn):
+    assert report_store.missing_ranges(conn, KEY, day(1), day(10), today=TODAY) == [(day(1), day(10))]
+
+def test_today_and_later_are_not_marked_fetched(conn):
+    # 当日以降は集計途中なので、保存しても取得済みにならない
+    report_store.save_frames(conn, KEY, _frames([day(n) for n in range(1, 11)]), day(1), day(10), today=TODAY)
+    assert report_store.missing_ranges(conn, KEY, day(1), day(10), today=TODAY) == [(day(8), day(10))]
+
+def test_refetch_days(conn):
+    # 直近 refetch_days 日は取得済みでも取り直す
+    report_store.save_frames(conn, KEY, _frames([day(n) for n in range(1, 8)]), day(1), day(7), today=TODAY)
+    assert report_store.missing_ranges(conn, KEY, day(1), day(10), refetch_days=2, today=TODAY) == [(day(6), day(10))]
+    # 別のキーの取得済みの日は数えない
+    assert report_store.missing_ranges(conn, 'other', day(1), day(3), today=TODAY) == [(day(1), day(3))]
+
+def test_missing_ranges_merges_adjacent_days(conn):
+    today = day(31)
+    report_store.save_frames(conn, KEY, _frames([day(1), day(2), day(3)]), day(1), day(3), today=today)
+    report_store.save_frames(conn, KEY, _frames([day(6), day(7)]), day(6), day(7), today=today)
+    ranges = report_store.missing_ranges(conn, KEY, day(1), day(10), today=today)
+    assert ranges == [(day(4), day(5)), (day(8), day(10))]
+
+def test_save_and_load_round_trip(conn):
+    frames = _frames([day(1), day(2)])
+    report_store.save_frames(conn, KEY, frames, day(1), day(2), today=TODAY)
+    loaded = report_store.load_frames(conn, KEY, day(1), day(2))
+
+    pd.testing.assert_frame_equal(loaded.campaigns, frames.campaigns)
+    pd.testing.assert_frame_equal(loaded.limits, frames.limits)
+    assert loaded.limits['month'].tolist() == ['202610']
+    records = loaded.records
+    assert records['campaign_id'].dtype == np.int64
+    assert records['target_date'].tolist() == [pd.Timestamp('2026-10-01'), pd.Timestamp('2026-10-02')]
+    assert records['net'].dtype == np.float64 and records['gross'].dtype == np.float64
+    assert records['impression'].dtype == np.int32 and records['click'].dtype == np.int32
+    assert records['gross'].tolist() == [100.0, 100.0]
+    assert records['impression'].tolist() == [1000, 1000]
+
+def test_save_replaces_records_in_range(conn):
+    # 取り直した期間の実績は置き換える（取り直しで消えた行も残さない）
+    report_store.save_frames(conn, KEY, _frames([day(1), day(2), day(3)]), day(1), day(3), today=TODAY)
+    report_store.save_frames(conn, KEY, _frames([day(2)], gross=250.0), day(2), day(3), today=TODAY)
+    records = report_store.load_frames(conn, KEY, day(1), day(3)).records
+    assert records['target_date'].dt.day.tolist() == [1, 2]
+    assert records['gross'].tolist() == [100.0, 250.0]
@@ -0,0 +1,29 @@
+import pandas as pd
+
+import report_parser
+import rollup
+
+def _cube(master_df):
+    records = pd.DataFrame([(1, pd.Timestamp('2026-10-01'), 80.0, 100.0, 10, 1)], columns=report_parser.RECORD_COLUMNS)
+    limits = pd.DataFrame(columns=report_parser.LIMIT_COLUMNS)
+    return rollup.RollupCube(records, master_df, limits, ['202610'])
+
+def test_duplicate_account_names_are_distinguished():
+    # 別の API Key から同名のアカウントが取れた場合は、取得元と ID を添えて選択肢を区別する
+    master_df = pd.DataFrame({
+        'campaign_id': [1, 2, 3], 'account_id': [10, 20, 30],
+        'account_name': ['A', 'A', 'B'], 'campaign_name': ['c1', 'c2', 'c3'],
+        'source': ['Key …k1', 'Key …k2', 'Key …k2'],
+    })
+    cube = _cube(master_df)
+    assert cube.label((rollup.LEVEL_ACCOUNT, 10)) == "【アカウント】A（Key …k1 / ID:10）"
+    assert cube.label((rollup.LEVEL_ACCOUNT, 20)) == "【アカウント】A（Key …k2 / ID:20）"
+    assert cube.label((rollup.LEVEL_ACCOUNT, 30)) == "【アカウント】B"
+
+def test_duplicate_account_names_without_source():
+    master_df = pd.DataFrame({
+        'campaign_id': [1, 2], 'account_id': [10, 20], 'account_name': ['A', 'A'], 'campaign_name': ['c1', 'c2'],
+    })
+    cube = _cube(master_df)
+    assert cube.label((rollup.LEVEL_ACCOUNT, 10)) == "【アカウント】A（ID:10）"
+    assert cube.label((rollup.LEVEL_ACCOUNT, 20)) == "【アカウント】A（ID:20）"
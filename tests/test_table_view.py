@@ -0,0 +1,28 @@
+import pandas as pd
+import pytest
+
+import table_view
+
+@pytest.fixture(params=['category', 'str'])
+def display_df(request):
+    # 名前列は build_master 以降はカテゴリ型、スナップショットの CSV などからは文字列型になる
+    df = pd.DataFrame({
+        'アカウント名': ['A', 'A', 'B', 'B'],
+        'キャンペーン名': ['Spring Sale', 'spring_brand', 'Autumn', None],
+        '乖離(pt)': [12.0, 5.0, -5.0, -20.0],
+    })
+    df['ステータス'] = table_view.pacing_bands(df['乖離(pt)'])
+    names = ['アカウント名', 'キャンペーン名']
+    df[names] = df[names].astype(request.param)
+    return df
+
+def test_filter_table_by_campaign_name(display_df):
+    # 部分一致・大文字小文字を区別しない。名前の欠損は一致しない
+    result = table_view.filter_table(display_df, query="SPRING")
+    assert result['キャンペーン名'].astype(str).tolist() == ['Spring Sale', 'spring_brand']
+    assert table_view.filter_table(display_df, query="none").empty
+
+def test_filter_table_combined(display_df):
+    result = table_view.filter_table(display_df, accounts=['A', 'B'], bands=['⬛順調', '🟨警戒'], query="a")
+    assert result['キャンペーン名'].astype(str).tolist() == ['spring_brand', 'Autumn']
+    assert len(table_view.filter_table(display_df)) == 4